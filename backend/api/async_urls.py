@@ -0,0 +1,14 @@
+from django.urls import path
+
+from api.async_views import (ingredient_list, recipe_detail, recipe_list,
+                             tag_detail, tag_list)
+
+app_name = 'api_async'
+
+urlpatterns = [
+    path('recipes/', recipe_list, name='recipe-list'),
+    path('recipes/<int:pk>/', recipe_detail, name='recipe-detail'),
+    path('ingredients/', ingredient_list, name='ingredient-list'),
+    path('tags/', tag_list, name='tag-list'),
+    path('tags/<int:pk>/', tag_detail, name='tag-detail'),
+]
@@ -0,0 +1,205 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django_filters.utils import translate_validation
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from api.authentication import authenticate
+from api.filters import IngredientFilter, RecipeFilter
+from api.caches import recipe_version
+from api.mixins import (add_conditional_headers, get_anonymous_cache_key,
+                        get_conditional_state, get_snapshot_response)
+from api.paginations import RecipePagination
+from api.renderers import FastJSONRenderer
+from api.serializers import (IngredientSerializer, RecipeReadSerializer,
+                             TagSerializer, get_sparse_fields)
+from api.throttling import check_throttles
+from api.views import IngredientViewSet, RecipeViewSet, TagViewSet
+from foodgram.dbrouters import primary_reads
+from foodgram.settings import RESPONSE_CACHE_TIMEOUT
+from recipes.models import Ingredient, Recipe, Tag
+
+
+def render(data, status=200, headers=None):
+    return HttpResponse(
+        FastJSONRenderer().render(data), status=status,
+        content_type='application/json', headers=headers,
+    )
+
+
+def serialize(serializer_class, instance, request, **kwargs):
+    """Сериализаторы рецептов ходят в кэш и БД синхронно."""
+    return serializer_class(
+        instance, context={'request': request}, **kwargs
+    ).data
+
+
+def async_read_view(fallback):
+    """
+    GET обслуживается асинхронной вьюхой, остальные методы,
+    браузерный API (?format=) и выборка по ?ids= — синхронным
+    вьюсетом fallback.
+    Вьюха получает Request DRF с уже определённым пользователем.
+    """
+    sync_fallback = sync_to_async(fallback)
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if (request.method != 'GET'
+                    or not {'format', 'ids'}.isdisjoint(request.GET)):
+                return await sync_fallback(request, *args, **kwargs)
+            try:
+                user = await sync_to_async(authenticate)(request)
+                request.user = user
+                drf_request = Request(request)
+                drf_request.user = user
+                return await view(drf_request, *args, **kwargs)
+            except APIException as error:
+                headers = None
+                if getattr(error, 'wait', None):
+                    headers = {'Retry-After': '%d' % error.wait}
+                if error.status_code == 401:
+                    authenticator = (
+                        api_settings.DEFAULT_AUTHENTICATION_CLASSES[0]()
+                    )
+                    headers = {'WWW-Authenticate':
+                               authenticator.authenticate_header(request)}
+                detail = error.detail
+                if not isinstance(detail, (dict, list)):
+                    detail = {'detail': detail}
+                return render(detail, error.status_code, headers)
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
+
+
+def filter_recipes(request):
+    """Форма фильтра проверяет автора запросом к БД."""
+    queryset = Recipe.objects.all()
+    if 'text' not in get_sparse_fields(request,
+                                       RecipeReadSerializer.Meta.fields):
+        queryset = queryset.defer('text')
+    filterset = RecipeFilter(
+        request.query_params, queryset=queryset, request=request
+    )
+    if not filterset.is_valid():
+        raise translate_validation(filterset.errors)
+    return filterset.qs
+
+
+async def recipe_response(request, queryset, get_data, pk=None):
+    """
+    ETag, 304 и кэш ответов анонимам как у RecipeViewSet:
+    ключи кэша общие с синхронными вьюсетами.
+    """
+    state = await sync_to_async(get_conditional_state)(
+        request, queryset, pk is not None
+    )
+    if state is not None:
+        response = get_conditional_response(request, etag=state[0])
+        if response is not None:
+            return add_conditional_headers(response, request, *state)
+    if pk is None:
+        route = 'recipe-list'
+        versions = RecipeViewSet.list_cache_versions
+    else:
+        route = 'recipe-retrieve'
+        versions = (recipe_version(pk), *RecipeViewSet.detail_cache_versions)
+    key = await sync_to_async(get_anonymous_cache_key)(
+        request, route, versions
+    )
+    data = key and await cache.aget(key)
+    if data is None:
+        with primary_reads():
+            data = await get_data()
+        if key:
+            await cache.aset(key, data, RESPONSE_CACHE_TIMEOUT)
+    response = render(data)
+    if state is None:
+        return response
+    return add_conditional_headers(response, request, *state)
+
+
+@async_read_view(RecipeViewSet.as_view({'get': 'list', 'post': 'create'}))
+async def recipe_list(request):
+    """Список рецептов с фильтрами и пагинацией как у RecipeViewSet."""
+    queryset = await sync_to_async(filter_recipes)(request)
+
+    async def get_data():
+        pagination = RecipePagination()
+        pagination.request = request
+        paginator = pagination.django_paginator_class(
+            queryset, pagination.get_page_size(request)
+        )
+        paginator.count = await queryset.acount()
+        page_number = pagination.get_page_number(request, paginator)
+        try:
+            page = paginator.page(page_number)
+        except InvalidPage as error:
+            raise NotFound(pagination.invalid_page_message.format(
+                page_number=page_number, message=str(error)
+            ))
+        page.object_list = [recipe async for recipe in page.object_list]
+        pagination.page = page
+        data = await sync_to_async(serialize)(
+            RecipeReadSerializer, page.object_list, request, many=True
+        )
+        return pagination.get_paginated_response(data).data
+
+    return await recipe_response(request, queryset, get_data)
+
+
+@async_read_view(RecipeViewSet.as_view({
+    'get': 'retrieve', 'put': 'update',
+    'patch': 'partial_update', 'delete': 'destroy',
+}))
+async def recipe_detail(request, pk):
+    queryset = Recipe.objects.filter(pk=pk)
+
+    async def get_data():
+        try:
+            recipe = await queryset.aget()
+        except Recipe.DoesNotExist:
+            raise NotFound
+        return await sync_to_async(serialize)(
+            RecipeReadSerializer, recipe, request
+        )
+
+    return await recipe_response(request, queryset, get_data, pk)
+
+
+@async_read_view(IngredientViewSet.as_view({'get': 'list'}))
+async def ingredient_list(request):
+    """Поиск ингредиентов по началу названия: ?name=."""
+    if not request.query_params:
+        return await sync_to_async(get_snapshot_response)(
+            request, 'ingredients'
+        )
+    if IngredientFilter.search_param in request.query_params:
+        await sync_to_async(check_throttles)(request, 'ingredient_search')
+    queryset = IngredientFilter().filter_queryset(
+        request, Ingredient.objects.all(), IngredientViewSet
+    )
+    ingredients = [ingredient async for ingredient in queryset]
+    return render(IngredientSerializer(ingredients, many=True).data)
+
+
+@async_read_view(TagViewSet.as_view({'get': 'list'}))
+async def tag_list(request):
+    return await sync_to_async(get_snapshot_response)(request, 'tags')
+
+
+@async_read_view(TagViewSet.as_view({'get': 'retrieve'}))
+async def tag_detail(request, pk):
+    try:
+        tag = await Tag.objects.aget(pk=pk)
+    except Tag.DoesNotExist:
+        raise NotFound
+    return render(TagSerializer(tag).data)
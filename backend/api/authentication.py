@@ -0,0 +1,48 @@
+import hashlib
+
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from foodgram.settings import AUTH_TOKEN_CACHE_TIMEOUT
+
+TOKEN_CACHE_KEY = 'auth-token:{}'
+
+
+def get_token_cache_key(key):
+    """Ключ кэша по хешу токена: сам токен в кэш не попадает."""
+    return TOKEN_CACHE_KEY.format(hashlib.sha256(key.encode()).hexdigest())
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication со снимком токена и пользователя в кэше.
+    Снимок сбрасывается сигналами при выходе, смене пароля
+    и деактивации пользователя, а в худшем случае живёт
+    AUTH_TOKEN_CACHE_TIMEOUT секунд.
+    """
+
+    def authenticate_credentials(self, key):
+        cache_key = get_token_cache_key(key)
+        token = cache.get(cache_key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(cache_key, token, AUTH_TOKEN_CACHE_TIMEOUT)
+            return user, token
+        if not token.user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        return token.user, token
+
+
+def authenticate(request):
+    """
+    Пользователь Django-запроса по классам аутентификации DRF
+    для кода вне вьюсетов. Ошибки токена — AuthenticationFailed.
+    """
+    return Request(request, authenticators=[
+        authenticator() for authenticator
+        in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    ]).user
@@ -0,0 +1,106 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.utils.http import urlencode
+
+from foodgram.dbrouters import primary_reads
+from foodgram.settings import FRAGMENT_CACHE_TIMEOUT
+
+VERSION_KEY = 'versions:{}'
+RESPONSE_KEY = 'response:{}:{}:{}'
+FRAGMENT_KEY = 'fragment:recipe:{}:{}:{}'
+
+
+def recipe_version(pk):
+    """Имя версии отдельного рецепта."""
+    return f'recipe:{pk}'
+
+
+def get_versions(*names):
+    """
+    Текущие версии данных.
+    Отсутствующая версия заводится от текущего времени, чтобы
+    после вытеснения из кэша не совпасть со старыми ключами.
+    """
+    keys = [VERSION_KEY.format(name) for name in names]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(*names):
+    """Смена версий: старые ключи кэша больше не читаются."""
+    for name in names:
+        key = VERSION_KEY.format(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def get_digest(value):
+    return hashlib.md5(value.encode(), usedforsecurity=False).hexdigest()
+
+
+def get_base_url(request):
+    """Адрес сайта: от него зависят ссылки на изображения и страницы."""
+    if request is None:
+        return ''
+    return request.build_absolute_uri('/')
+
+
+def get_query_digest(request):
+    """Хэш адреса сайта и упорядоченных параметров запроса."""
+    params = sorted(
+        (name, value)
+        for name, values in request.query_params.lists()
+        for value in values
+        if value
+    )
+    return get_digest(f'{get_base_url(request)}?{urlencode(params)}')
+
+
+def get_response_cache_key(request, route, versions):
+    """Ключ ответа по маршруту, версиям данных и параметрам запроса."""
+    return RESPONSE_KEY.format(
+        route, '.'.join(map(str, versions)), get_query_digest(request)
+    )
+
+
+def get_recipe_fragments(recipes, render, request, fields=None):
+    """
+    Не зависящие от пользователя представления рецептов.
+    Берутся из кэша одним get_many, недостающие отрисовываются
+    через render(recipes) -> {pk: fragment} и сохраняются.
+    Урезанные ?fields= представления кэшируются отдельно.
+    """
+    pks = [recipe.pk for recipe in recipes]
+    *versions, tags, ingredients = get_versions(
+        *map(recipe_version, pks), 'tags', 'ingredients'
+    )
+    digest = get_digest(get_base_url(request))
+    if fields is not None:
+        digest = get_digest(f'{digest}:{",".join(fields)}')
+    keys = {
+        pk: FRAGMENT_KEY.format(
+            pk, f'{version}.{tags}.{ingredients}', digest
+        )
+        for pk, version in zip(pks, versions)
+    }
+    fragments = cache.get_many(keys.values())
+    missing = [
+        recipe for recipe in recipes if keys[recipe.pk] not in fragments
+    ]
+    if missing:
+        with primary_reads():
+            rendered = {
+                keys[pk]: fragment
+                for pk, fragment in render(missing).items()
+            }
+        cache.set_many(rendered, FRAGMENT_CACHE_TIMEOUT)
+        fragments.update(rendered)
+    return {pk: fragments[key] for pk, key in keys.items()}
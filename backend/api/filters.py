@@ -1,12 +1,30 @@
 import django_filters as filters
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
 from rest_framework.filters import SearchFilter
 
-from recipes.models import Ingredient, Recipe
+from foodgram.dbrouters import primary_reads
+from foodgram.settings import TAG_CHOICES_CACHE_TIMEOUT
+from recipes.models import (Favorite, Ingredient, IngredientAmount, Recipe,
+                            ShoppingCart, Tag)
 from users.models import User
 
+TAG_CHOICES_CACHE_KEY = 'filters:tag-choices'
+
+
+def get_tag_choices():
+    """Слаги тегов для фильтра, кэшируются до изменения тегов."""
+    choices = cache.get(TAG_CHOICES_CACHE_KEY)
+    if choices is None:
+        with primary_reads():
+            choices = list(Tag.objects.values_list('slug', 'name'))
+        cache.set(TAG_CHOICES_CACHE_KEY, choices, TAG_CHOICES_CACHE_TIMEOUT)
+    return choices
+
 
 class IngredientFilter(SearchFilter):
-    """Фильтрация ингридиентов."""
+    """Фильтрация ингридиентов по началу названия: ?name=."""
+    search_param = 'name'
 
     name = filters.CharFilter(lookup_expr='istartswith')
 
@@ -15,6 +33,26 @@ class IngredientFilter(SearchFilter):
         fields = ('name',)
 
 
+class RepeatedCSVWidget(filters.widgets.CSVWidget):
+    """Значения через запятую и повтором параметра: ?a=1,2&a=3."""
+
+    def value_from_datadict(self, data, files, name):
+        if not hasattr(data, 'getlist') or name not in data:
+            return super().value_from_datadict(data, files, name)
+        return [
+            value for param in data.getlist(name)
+            for value in param.split(',') if value
+        ]
+
+
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    """Фильтр по списку id через запятую или повтором параметра."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('widget', RepeatedCSVWidget)
+        super().__init__(*args, **kwargs)
+
+
 class RecipeFilter(filters.FilterSet):
     """Фильтрация рецептов."""
     RECIPE_CHOICES = (
@@ -32,22 +70,77 @@ class RecipeFilter(filters.FilterSet):
         choices=RECIPE_CHOICES,
         method='get_is_in'
     )
-    tags = filters.AllValuesMultipleFilter(
-        field_name='tags__slug',
+    tags = filters.MultipleChoiceFilter(
+        choices=get_tag_choices,
+        method='get_tags',
         label='Ссылка'
     )
+    ingredients = NumberInFilter(
+        method='get_ingredients',
+        label='Содержит все ингредиенты'
+    )
+    exclude_ingredients = NumberInFilter(
+        method='get_exclude_ingredients',
+        label='Не содержит ингредиенты'
+    )
+    cooking_time_min = filters.NumberFilter(
+        field_name='cooking_time',
+        lookup_expr='gte'
+    )
+    cooking_time_max = filters.NumberFilter(
+        field_name='cooking_time',
+        lookup_expr='lte'
+    )
 
     def get_is_in(self, queryset: list, name: str, value: str):
         """
         Фильтрация рецептов по избранному и списку покупок.
         """
+        if value != '1':
+            return queryset
         user = self.request.user
-        if user.is_authenticated:
-            if value == '1':
-                if name == 'is_favorited':
-                    queryset = queryset.filter(favorite_recipes__user=user)
+        if not user.is_authenticated:
+            return queryset.none()
+        model = Favorite if name == 'is_favorited' else ShoppingCart
+        return queryset.filter(Exists(
+            model.objects.filter(user=user, recipe=OuterRef('pk'))
+        ))
+
+    def get_tags(self, queryset, name, value):
+        """Рецепты хотя бы с одним из тегов, без DISTINCT."""
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'),
+                tag__slug__in=value
+            )
+        ))
+
+    @staticmethod
+    def ingredient_amounts(ingredients):
+        return IngredientAmount.objects.filter(
+            recipe=OuterRef('pk'),
+            ingredient__in=ingredients
+        )
+
+    def get_ingredients(self, queryset, name, value):
+        """
+        Рецепты, в которых есть каждый из ингредиентов.
+        Отдельный EXISTS на ингредиент не размножает строки рецептов.
+        """
+        for ingredient in set(value):
+            queryset = queryset.filter(
+                Exists(self.ingredient_amounts((ingredient,)))
+            )
         return queryset
 
+    def get_exclude_ingredients(self, queryset, name, value):
+        """Рецепты без указанных ингредиентов."""
+        if not value:
+            return queryset
+        return queryset.filter(~Exists(self.ingredient_amounts(value)))
+
     class Meta:
         model = Recipe
-        fields = ('is_favorited', 'is_in_shopping_cart', 'author', 'tags')
+        fields = ('is_favorited', 'is_in_shopping_cart', 'author', 'tags',
+                  'ingredients', 'exclude_ingredients',
+                  'cooking_time_min', 'cooking_time_max')
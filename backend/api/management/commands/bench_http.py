@@ -0,0 +1,220 @@
+import json
+import re
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from time import perf_counter
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from foodgram.settings import BASE_DIR
+
+COLLECTION = (BASE_DIR.parent / 'postman-collection'
+              / 'diploma.postman_collection.json')
+VARIABLE = re.compile(r'{{(\w+)}}')
+PERCENTILES = (50, 95, 99)
+
+
+def get_requests(items, auth=None):
+    """
+    GET-запросы коллекции с учётом наследуемой авторизации.
+    Папки с негативными сценариями пропускаются: они проверяют
+    ошибки, а не скорость.
+    """
+    for item in items:
+        item_auth = item.get('auth') or auth
+        if 'item' in item:
+            if 'bad_requests' not in item['name']:
+                yield from get_requests(item['item'], item_auth)
+            continue
+        request = item['request']
+        if request['method'] != 'GET':
+            continue
+        url = request['url']
+        yield (
+            item['name'],
+            url['raw'] if isinstance(url, dict) else url,
+            request.get('auth') or item_auth,
+        )
+
+
+def get_headers(auth, variables):
+    if not auth or auth['type'] != 'apikey':
+        return {}
+    options = {option['key']: option['value'] for option in auth['apikey']}
+    return {options['key']: substitute(options['value'], variables)}
+
+
+def substitute(value, variables):
+    def replace(match):
+        name = match.group(1)
+        if name not in variables:
+            raise KeyError(name)
+        return str(variables[name]).strip('"')
+    return VARIABLE.sub(replace, value)
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет GET-сценарии postman-коллекции против запущенного '
+            'сервера и печатает p50/p95/p99 и пропускную способность '
+            'по каждому запросу.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--collection', default=COLLECTION)
+        parser.add_argument('--email', help='Пользователь для запросов '
+                                            'с токеном.')
+        parser.add_argument('--password')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Число запросов на каждый сценарий.')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--output', help='Файл для результатов в JSON.')
+        parser.add_argument('--compare', help='JSON прошлого прогона '
+                                              'для сравнения p95.')
+
+    def handle(self, *args, **options):
+        self.base_url = options['base_url'].rstrip('/')
+        self.local = threading.local()
+        with open(options['collection'], encoding='utf-8') as file:
+            collection = json.load(file)
+        variables = {
+            variable['key']: variable['value']
+            for variable in collection.get('variable', ())
+        }
+        variables.update(self.discover(options['email'],
+                                       options['password']))
+        results = []
+        for name, raw_url, auth in get_requests(collection['item']):
+            try:
+                url = substitute(raw_url, variables)
+                headers = get_headers(auth, variables)
+            except KeyError as error:
+                self.stderr.write(f'Пропущен {name}: нет переменной {error}')
+                continue
+            results.append(self.measure(name, url, headers, options))
+        if not results:
+            raise CommandError('Нет запросов для замера.')
+        baseline = {}
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                baseline = {
+                    result['key']: result
+                    for result in json.load(file)['results']
+                }
+        self.report(results, baseline)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({
+                    'started': datetime.now(timezone.utc).isoformat(),
+                    'base_url': self.base_url,
+                    'requests': options['requests'],
+                    'concurrency': options['concurrency'],
+                    'results': results,
+                }, file, ensure_ascii=False, indent=2)
+
+    def get_session(self):
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def discover(self, email, password):
+        """
+        Значения, которые коллекция сохраняет по ходу сценария:
+        токен, id пользователей, тегов, ингредиентов и рецептов.
+        """
+        variables = {'baseUrl': self.base_url}
+        session = self.get_session()
+        if email and password:
+            response = session.post(
+                f'{self.base_url}/api/auth/token/login/',
+                json={'email': email, 'password': password},
+            )
+            if response.status_code != 200:
+                raise CommandError(f'Не удалось войти: {response.text}')
+            token = response.json()['auth_token']
+            variables['userToken'] = variables['secondUserToken'] = token
+            me = session.get(f'{self.base_url}/api/users/me/',
+                             headers={'Authorization': f'Token {token}'})
+            variables['userId'] = me.json()['id']
+        ordinals = ('first', 'second', 'third', 'fourth', 'fifth')
+        users = session.get(f'{self.base_url}/api/users/?limit=3').json()
+        for ordinal, user in zip(ordinals, users['results']):
+            variables.setdefault(f'{ordinal}UserId', user['id'])
+        variables.setdefault('userId', variables.get('firstUserId'))
+        for ordinal, tag in zip(ordinals,
+                                session.get(f'{self.base_url}/api/tags/')
+                                .json()):
+            variables[f'{ordinal}TagId'] = tag['id']
+            variables[f'{ordinal}TagSlug'] = tag['slug']
+        ingredients = session.get(f'{self.base_url}/api/ingredients/').json()
+        for ordinal, ingredient in zip(ordinals, ingredients):
+            variables[f'{ordinal}IndredientId'] = ingredient['id']
+        if ingredients:
+            variables['ingredientNameFirstLatter'] = ingredients[0]['name'][0]
+        recipes = session.get(f'{self.base_url}/api/recipes/?limit=5').json()
+        for ordinal, recipe in zip(ordinals, recipes['results']):
+            variables[f'{ordinal}RecipeId'] = recipe['id']
+        return {
+            name: value for name, value in variables.items()
+            if value is not None
+        }
+
+    def request(self, url, headers):
+        start = perf_counter()
+        response = self.get_session().get(url, headers=headers)
+        return perf_counter() - start, response.status_code
+
+    def measure(self, name, url, headers, options):
+        for _ in range(options['warmup']):
+            self.request(url, headers)
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            start = perf_counter()
+            samples = list(executor.map(
+                lambda _: self.request(url, headers),
+                range(options['requests']),
+            ))
+            elapsed = perf_counter() - start
+        latencies = sorted(latency for latency, _ in samples)
+        statuses = {}
+        for _, status in samples:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        quantiles = (
+            statistics.quantiles(latencies, n=100, method='inclusive')
+            if len(latencies) > 1 else latencies * 99
+        )
+        path = url[len(self.base_url):]
+        return {
+            'key': f'{name} {path} {"auth" if headers else "anon"}',
+            'name': name,
+            'path': path,
+            'authenticated': bool(headers),
+            'count': len(latencies),
+            'statuses': statuses,
+            'throughput': len(latencies) / elapsed,
+            'mean': statistics.fmean(latencies),
+            **{f'p{percentile}': quantiles[percentile - 1]
+               for percentile in PERCENTILES},
+        }
+
+    def report(self, results, baseline):
+        self.stdout.write(
+            f'{"запрос":<60} {"p50 мс":>8} {"p95 мс":>8} {"p99 мс":>8} '
+            f'{"зап/с":>8}'
+        )
+        for result in results:
+            line = (
+                f'{result["key"][:60]:<60} '
+                + ' '.join(f'{result[f"p{percentile}"] * 1000:>8.1f}'
+                           for percentile in PERCENTILES)
+                + f' {result["throughput"]:>8.1f}'
+            )
+            previous = baseline.get(result['key'])
+            if previous:
+                change = result['p95'] / previous['p95'] - 1
+                line += f' p95 {change:+.0%}'
+            if set(result['statuses']) - {'200'}:
+                line += f' коды {result["statuses"]}'
+            self.stdout.write(line)
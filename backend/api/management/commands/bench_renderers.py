@@ -0,0 +1,77 @@
+import base64
+import io
+import os
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer, orjson
+from api.serializers import RecipeReadSerializer
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает скорость JSONRenderer/JSONParser и их orjson-версий '
+            'на страницах RecipeReadSerializer.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=500)
+        parser.add_argument('--image-kb', type=int, default=512,
+                            help='Размер картинки в теле создания рецепта.')
+
+    def measure(self, name, func, repeat, size):
+        func()
+        start = perf_counter()
+        for _ in range(repeat):
+            func()
+        elapsed = perf_counter() - start
+        self.stdout.write(
+            f'{name:<28} {repeat / elapsed:>10.1f} оп/с '
+            f'{size * repeat / elapsed / 2 ** 20:>8.1f} МБ/с'
+        )
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stderr.write('orjson не установлен, сравнивается '
+                              'стандартная реализация с самой собой.')
+        recipes = list(Recipe.objects.all()[:options['page_size']])
+        if not recipes:
+            raise CommandError('Нет рецептов: сначала заполните базу.')
+        request = Request(
+            APIRequestFactory().get('/api/recipes/', HTTP_HOST='localhost')
+        )
+        page = {
+            'count': len(recipes),
+            'next': None,
+            'previous': None,
+            'results': RecipeReadSerializer(
+                recipes, many=True, context={'request': request}
+            ).data,
+        }
+        repeat = options['repeat']
+        self.stdout.write(f'Страница: {len(recipes)} рецептов')
+        for renderer in (JSONRenderer(), FastJSONRenderer()):
+            content = renderer.render(page)
+            self.measure(type(renderer).__name__,
+                         lambda: renderer.render(page), repeat, len(content))
+
+        image = base64.b64encode(os.urandom(options['image_kb'] * 1024))
+        body = JSONRenderer().render({
+            'ingredients': [{'id': 1, 'amount': 10}],
+            'tags': [1],
+            'image': 'data:image/png;base64,' + image.decode(),
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+        })
+        self.stdout.write(f'Тело создания рецепта: {len(body)} байт')
+        for parser in (JSONParser(), FastJSONParser()):
+            self.measure(type(parser).__name__,
+                         lambda: parser.parse(io.BytesIO(body)),
+                         max(repeat // 10, 1), len(body))
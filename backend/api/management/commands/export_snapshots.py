@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.snapshots import SNAPSHOTS, write_snapshot
+
+
+class Command(BaseCommand):
+    help = ('Записывает снимки тегов и ингредиентов в SNAPSHOT_ROOT, '
+            'откуда их раздаёт nginx. Дальше файлы обновляются '
+            'при каждом изменении тегов и ингредиентов.')
+
+    def handle(self, *args, **options):
+        for name in SNAPSHOTS:
+            path, etag, size = write_snapshot(name, create=True)
+            self.stdout.write(f'{path} {etag} {size} байт')
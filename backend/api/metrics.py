@@ -0,0 +1,162 @@
+import json
+import os
+import threading
+from collections import defaultdict
+from pathlib import Path
+from time import monotonic
+
+from foodgram.settings import METRICS_DIR, METRICS_FLUSH_INTERVAL
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def get_key(name, labels):
+    return name, tuple(sorted(
+        (label, str(value)) for label, value in labels.items()
+    ))
+
+
+class Registry:
+    """
+    Счётчики и гистограммы процесса.
+    Если задан METRICS_DIR, каждый процесс периодически сбрасывает
+    свои значения в отдельный файл, а экспорт складывает все файлы:
+    так метрики видны из любого воркера gunicorn.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = Path(directory) if directory else None
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self.flushed = 0
+
+    def inc(self, name, labels, value=1):
+        key = get_key(name, labels)
+        with self.lock:
+            self.counters[key] += value
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        key = get_key(name, labels)
+        with self.lock:
+            histogram = self.histograms.setdefault(key, {
+                'buckets': list(buckets),
+                'counts': [0] * len(buckets),
+                'sum': 0.0,
+                'count': 0,
+            })
+            for index, bound in enumerate(histogram['buckets']):
+                if value <= bound:
+                    histogram['counts'][index] += 1
+                    break
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def dump(self):
+        with self.lock:
+            return {
+                'counters': [
+                    [name, labels, value]
+                    for (name, labels), value in self.counters.items()
+                ],
+                'histograms': [
+                    [name, labels, dict(histogram,
+                                        counts=list(histogram['counts']))]
+                    for (name, labels), histogram in self.histograms.items()
+                ],
+            }
+
+    @property
+    def path(self):
+        return self.directory / f'{os.getpid()}.json'
+
+    def flush(self, force=False):
+        """Сброс значений процесса в METRICS_DIR не чаще интервала."""
+        if self.directory is None:
+            return
+        now = monotonic()
+        if not force and now - self.flushed < METRICS_FLUSH_INTERVAL:
+            return
+        self.flushed = now
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(self.dump()))
+        tmp_path.replace(self.path)
+
+    def collect(self):
+        """Значения всех процессов, сложенные по имени и меткам."""
+        dumps = [self.dump()]
+        if self.directory is not None and self.directory.exists():
+            for path in self.directory.glob('*.json'):
+                if path != self.path:
+                    dumps.append(json.loads(path.read_text()))
+        counters = defaultdict(float)
+        histograms = {}
+        for dump in dumps:
+            for name, labels, value in dump['counters']:
+                counters[name, tuple(map(tuple, labels))] += value
+            for name, labels, histogram in dump['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                if key not in histograms:
+                    histograms[key] = dict(
+                        histogram, counts=list(histogram['counts'])
+                    )
+                    continue
+                total = histograms[key]
+                total['counts'] = [
+                    a + b for a, b in zip(total['counts'], histogram['counts'])
+                ]
+                total['sum'] += histogram['sum']
+                total['count'] += histogram['count']
+        return counters, histograms
+
+    def render(self):
+        """Текстовый формат Prometheus."""
+        counters, histograms = self.collect()
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f'# TYPE {name} counter')
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{format_labels(labels)} {value:.15g}')
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f'# TYPE {name} histogram')
+            for (metric, labels), histogram in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(histogram['buckets'],
+                                        histogram['counts']):
+                    cumulative += count
+                    bucket_labels = labels + (('le', f'{bound:g}'),)
+                    lines.append(f'{name}_bucket'
+                                 f'{format_labels(bucket_labels)} '
+                                 f'{cumulative}')
+                bucket_labels = labels + (('le', '+Inf'),)
+                lines.append(f'{name}_bucket{format_labels(bucket_labels)} '
+                             f'{histogram["count"]}')
+                lines.append(f'{name}_sum{format_labels(labels)} '
+                             f'{histogram["sum"]:.15g}')
+                lines.append(f'{name}_count{format_labels(labels)} '
+                             f'{histogram["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(
+            key,
+            str(value).replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n')
+        )
+        for key, value in labels
+    )
+    return '{' + pairs + '}'
+
+
+registry = Registry(METRICS_DIR)
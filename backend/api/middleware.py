@@ -0,0 +1,377 @@
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import threading
+import traceback
+import tracemalloc
+from contextlib import ExitStack
+from functools import wraps
+from time import monotonic, perf_counter
+from uuid import uuid4
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.cache import cache
+from django.db import DatabaseError, connections, transaction
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+
+from api.authentication import authenticate
+from api.caches import get_digest
+from api.metrics import QUERY_COUNT_BUCKETS, registry
+from foodgram.dbrouters import read_from_replica
+from foodgram.settings import (DB_REPLICAS, PROFILE_DIR, PROFILE_MEMORY_TOP,
+                               PROFILE_TRACEMALLOC_FRAMES, PROFILING_ENABLED,
+                               REPLICA_PIN_SECONDS, SLOW_QUERY_NO_PLAN_TABLES,
+                               SLOW_QUERY_RATE_LIMIT, SLOW_QUERY_SAMPLE_RATE,
+                               SLOW_QUERY_THRESHOLD)
+
+REQUEST_ID_PATTERN = re.compile(r'[\w-]{1,64}', re.ASCII)
+REPLICA_VIEW_MODULES = ('api.views', 'api.async_views')
+PIN_COOKIE = 'db_primary'
+PIN_KEY = 'replica-pin:{}'
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+EXPLAIN_PREFIXES = {
+    'postgresql': 'EXPLAIN (ANALYZE off) ',
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'mysql': 'EXPLAIN ',
+}
+
+
+class QueryCounter:
+    """execute_wrapper: число и суммарное время SQL-запросов."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += perf_counter() - start
+
+
+def get_route(request):
+    """Имя маршрута: api:recipe-list, api:user-subscriptions и т.п."""
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unmatched'
+
+
+class AsyncCapableMiddleware:
+    """
+    Основа middleware, работающих и под WSGI, и под ASGI:
+    без async_capable Django гонит каждый запрос асинхронных
+    вьюх через поток и асинхронность теряется.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.acall(request)
+        return self.call(request)
+
+    def call(self, request):
+        return self.get_response(request)
+
+    async def acall(self, request):
+        return await self.get_response(request)
+
+
+def instrument_connect(connection):
+    """
+    Время установки новых соединений с БД. При постоянных
+    соединениях метрика растёт только при переподключениях.
+    """
+    if getattr(connection, 'connect_instrumented', False):
+        return
+    get_new_connection = connection.get_new_connection
+
+    @wraps(get_new_connection)
+    def timed_get_new_connection(conn_params):
+        start = perf_counter()
+        try:
+            return get_new_connection(conn_params)
+        finally:
+            registry.observe('foodgram_db_connection_acquire_seconds',
+                             {'alias': connection.alias},
+                             perf_counter() - start)
+
+    connection.get_new_connection = timed_get_new_connection
+    connection.connect_instrumented = True
+
+
+class MetricsMiddleware(AsyncCapableMiddleware):
+    """
+    Время ответа, число и время SQL-запросов по маршрутам.
+    Под ASGI запросы ORM выполняются в общем потоке sync_to_async,
+    где их не разделить по запросам, поэтому пишется только время.
+    """
+
+    def call(self, request):
+        counter = QueryCounter()
+        start = perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                instrument_connect(connection)
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        self.record(request, response, perf_counter() - start, counter)
+        return response
+
+    async def acall(self, request):
+        start = perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, perf_counter() - start)
+        return response
+
+    def record(self, request, response, duration, counter=None):
+        route = get_route(request)
+        labels = {'route': route, 'method': request.method}
+        registry.inc('foodgram_http_requests_total',
+                     {**labels, 'status': response.status_code})
+        registry.observe('foodgram_http_request_duration_seconds',
+                         labels, duration)
+        if counter is not None:
+            registry.observe('foodgram_db_queries_per_request',
+                             labels, counter.count, QUERY_COUNT_BUCKETS)
+            registry.inc('foodgram_db_queries_total', labels, counter.count)
+            registry.inc('foodgram_db_query_duration_seconds_total',
+                         labels, counter.duration)
+        registry.flush()
+
+
+class ReplicaMiddleware(AsyncCapableMiddleware):
+    """
+    Безопасные запросы к вьюхам api читают с реплик.
+    После успешной записи клиент REPLICA_PIN_SECONDS читает
+    с основной базы, чтобы увидеть свои изменения: по cookie
+    и по ключу кэша от заголовка Authorization для клиентов
+    без cookie.
+    """
+
+    def call(self, request):
+        token = read_from_replica.set(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            read_from_replica.reset(token)
+        self.pin(request, response)
+        return response
+
+    async def acall(self, request):
+        token = read_from_replica.set(False)
+        try:
+            response = await self.get_response(request)
+        finally:
+            read_from_replica.reset(token)
+        self.pin(request, response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_module = getattr(view_func, 'cls', view_func).__module__
+        if (DB_REPLICAS and request.method in SAFE_METHODS
+                and view_module in REPLICA_VIEW_MODULES
+                and not self.is_pinned(request)):
+            read_from_replica.set(True)
+
+    def is_pinned(self, request):
+        authorization = request.headers.get('Authorization')
+        return bool(
+            request.COOKIES.get(PIN_COOKIE)
+            or authorization and cache.get(get_pin_key(authorization))
+        )
+
+    def pin(self, request, response):
+        if (not DB_REPLICAS or request.method in SAFE_METHODS
+                or response.status_code >= 400):
+            return
+        response.set_cookie(PIN_COOKIE, '1', max_age=REPLICA_PIN_SECONDS,
+                            httponly=True, samesite='Lax')
+        authorization = request.headers.get('Authorization')
+        if authorization:
+            cache.set(get_pin_key(authorization), True, REPLICA_PIN_SECONDS)
+
+
+def get_pin_key(authorization):
+    return PIN_KEY.format(get_digest(authorization))
+
+
+class SlowQueryLogger:
+    """
+    execute_wrapper: запросы дольше порога пишутся в лог slow_queries
+    JSON-строкой с типами параметров, планом EXPLAIN и кадрами стека
+    из api/. Значения параметров не пишутся: среди них ключи токенов,
+    хеши паролей и почта.
+    """
+    local = threading.local()
+
+    def __init__(self, request):
+        self.request = request
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(self.local, 'explaining', False):
+            return execute(sql, params, many, context)
+        start = perf_counter()
+        result = execute(sql, params, many, context)
+        duration = perf_counter() - start
+        if (duration >= SLOW_QUERY_THRESHOLD
+                and random.random() < SLOW_QUERY_SAMPLE_RATE
+                and slow_query_limiter.allow()):
+            slow_query_logger.warning(json.dumps({
+                'time': timezone.now().isoformat(),
+                'duration': round(duration, 6),
+                'route': get_route(self.request),
+                'method': self.request.method,
+                'path': self.request.path,
+                'request_id': self.request.headers.get('X-Request-ID'),
+                'sql': sql,
+                'params': None if many else get_param_types(params),
+                'plan': None if many else self.explain(
+                    context['connection'], sql, params
+                ),
+                'stack': get_api_stack(),
+            }, ensure_ascii=False))
+        return result
+
+    def explain(self, connection, sql, params):
+        prefix = EXPLAIN_PREFIXES.get(connection.vendor)
+        if (prefix is None
+                or not sql.lstrip().upper().startswith('SELECT')
+                or any(table in sql for table in SLOW_QUERY_NO_PLAN_TABLES)):
+            return None
+        self.local.explaining = True
+        try:
+            with transaction.atomic(using=connection.alias):
+                with connection.cursor() as cursor:
+                    cursor.execute(prefix + sql, params)
+                    return [' '.join(map(str, row))
+                            for row in cursor.fetchall()]
+        except DatabaseError as error:
+            return [f'EXPLAIN failed: {error}']
+        finally:
+            self.local.explaining = False
+
+
+class RateLimiter:
+    """Не больше limit событий в минуту на процесс."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.window = None
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        window = int(monotonic() // 60)
+        with self.lock:
+            if window != self.window:
+                self.window = window
+                self.count = 0
+            self.count += 1
+            return self.count <= self.limit
+
+
+def get_param_types(params):
+    """Число и типы параметров запроса без самих значений."""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        params = params.values()
+    return [type(value).__name__ for value in params]
+
+
+def get_api_stack():
+    """Кадры стека из пакета api, откуда пришёл запрос."""
+    return [
+        f'{frame.filename}:{frame.lineno} in {frame.name}: {frame.line}'
+        for frame in traceback.extract_stack()
+        if frame.filename.startswith(API_DIR)
+        and not frame.filename.endswith('middleware.py')
+    ]
+
+
+slow_query_logger = logging.getLogger('slow_queries')
+slow_query_limiter = RateLimiter(SLOW_QUERY_RATE_LIMIT)
+
+
+class SlowQueryLogMiddleware(AsyncCapableMiddleware):
+    """
+    Подключает SlowQueryLogger ко всем соединениям на время запроса.
+    Асинхронные запросы пропускаются, как и в MetricsMiddleware.
+    """
+
+    def call(self, request):
+        logger = SlowQueryLogger(request)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(logger))
+            return self.get_response(request)
+
+
+class ProfilingMiddleware(AsyncCapableMiddleware):
+    """
+    Профилирование одного запроса по заголовку X-Profile
+    или параметру _profile, только для администраторов.
+    cpu - дамп cProfile (pstats), memory - топ выделений tracemalloc;
+    любое другое значение включает оба. Файлы пишутся в PROFILE_DIR
+    под id запроса, id возвращается в заголовке X-Profile-Id.
+    Работает только под WSGI.
+    """
+
+    def call(self, request):
+        mode = (request.headers.get('X-Profile')
+                or request.GET.get('_profile'))
+        if not PROFILING_ENABLED or not mode or not is_admin(request):
+            return self.get_response(request)
+        request_id = request.headers.get('X-Request-ID', '')
+        if not REQUEST_ID_PATTERN.fullmatch(request_id):
+            request_id = uuid4().hex
+        cpu = mode != 'memory'
+        memory = mode != 'cpu'
+        profiler = cProfile.Profile()
+        if memory:
+            tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+        if cpu:
+            profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            if cpu:
+                profiler.disable()
+            if memory:
+                snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        if cpu:
+            profiler.dump_stats(PROFILE_DIR / f'{request_id}.prof')
+        if memory:
+            stats = snapshot.statistics('lineno')[:PROFILE_MEMORY_TOP]
+            (PROFILE_DIR / f'{request_id}.memory.txt').write_text(
+                f'{request.method} {request.get_full_path()}\n'
+                + '\n'.join(map(str, stats)) + '\n'
+            )
+        response['X-Profile-Id'] = request_id
+        return response
+
+
+def is_admin(request):
+    """Пользователь сессии или токена DRF с правами администратора."""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        try:
+            user = authenticate(request)
+        except APIException:
+            return False
+    return user.is_staff
@@ -0,0 +1,229 @@
+from calendar import timegm
+
+from django.core.cache import cache
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.http import HttpResponse
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from api.caches import (get_digest, get_query_digest, get_response_cache_key,
+                        get_versions, recipe_version)
+from api.snapshots import get_snapshot
+from foodgram.dbrouters import primary_reads
+from foodgram.settings import (BATCH_IDS_LIMIT, RESPONSE_CACHE_TIMEOUT,
+                               SNAPSHOT_MAX_AGE)
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscribe, User
+
+
+def get_user_state(user):
+    """
+    Состояние избранного, корзины и подписок пользователя
+    одним запросом: количество и последний id в каждой таблице.
+    """
+    if user.is_anonymous:
+        return ()
+    subqueries = {}
+    for model in (Favorite, ShoppingCart, Subscribe):
+        rows = model.objects.filter(
+            user=OuterRef('pk')
+        ).order_by().values('user')
+        name = model._meta.model_name
+        subqueries[f'{name}_count'] = Subquery(
+            rows.annotate(value=Count('pk')).values('value')
+        )
+        subqueries[f'{name}_last'] = Subquery(
+            rows.annotate(value=Max('pk')).values('value')
+        )
+    return User.objects.filter(pk=user.pk).annotate(
+        **subqueries
+    ).values_list(*subqueries).get()
+
+
+def get_batch_ids(request):
+    """
+    Id из ?ids=1,2,3 без повторов в порядке запроса
+    или None, если параметра нет.
+    """
+    if 'ids' not in request.query_params:
+        return None
+    values = [
+        value.strip() for param in request.query_params.getlist('ids')
+        for value in param.split(',') if value.strip()
+    ]
+    if not values or not all(value.isdigit() for value in values):
+        raise ValidationError({'ids': 'Ожидаются числовые id через запятую.'})
+    ids = list(dict.fromkeys(map(int, values)))
+    if len(ids) > BATCH_IDS_LIMIT:
+        raise ValidationError(
+            {'ids': f'Не больше {BATCH_IDS_LIMIT} id за запрос.'}
+        )
+    return ids
+
+
+class BatchRetrieveMixin:
+    """
+    ?ids= в списке: объекты по id одним in_bulk в порядке запроса,
+    без пагинации и фильтров. Несуществующие и скрытые queryset
+    id пропускаются, к остальным применяются проверки страницы объекта.
+    """
+
+    def filter_queryset(self, queryset):
+        ids = get_batch_ids(self.request)
+        if ids is None:
+            return super().filter_queryset(queryset)
+        return queryset.filter(pk__in=ids)
+
+    def list(self, request, *args, **kwargs):
+        ids = get_batch_ids(request)
+        if ids is None:
+            return super().list(request, *args, **kwargs)
+        objects = self.get_queryset().in_bulk(ids)
+        instances = [objects[pk] for pk in ids if pk in objects]
+        for instance in instances:
+            self.check_object_permissions(request, instance)
+        return Response(self.get_serializer(instances, many=True).data)
+
+
+class AnonymousCacheMixin:
+    """
+    Кэширование списка и страницы рецепта для анонимных пользователей.
+    Ключ включает версии данных, которые меняются по сигналам.
+    """
+    list_cache_versions = ('recipes', 'tags', 'ingredients')
+    detail_cache_versions = ('tags', 'ingredients')
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().list, self.list_cache_versions,
+            request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        versions = (recipe_version(pk), *self.detail_cache_versions)
+        return self.cached_response(
+            super().retrieve, versions, request, *args, **kwargs
+        )
+
+    def cached_response(self, handler, versions, request, *args, **kwargs):
+        key = get_anonymous_cache_key(
+            request, f'{self.basename}-{self.action}', versions
+        )
+        if key is None:
+            return handler(request, *args, **kwargs)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        with primary_reads():
+            response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, RESPONSE_CACHE_TIMEOUT)
+        return response
+
+
+def get_anonymous_cache_key(request, route, versions):
+    """Ключ кэша ответа анониму или None для пользователя."""
+    if not request.user.is_anonymous:
+        return None
+    return get_response_cache_key(request, route, get_versions(*versions))
+
+
+def get_snapshot_response(request, name):
+    """Снимок JSON с ETag и долгим Cache-Control или 304."""
+    content, etag = get_snapshot(name)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=SNAPSHOT_MAX_AGE)
+    return response
+
+
+class SnapshotListMixin:
+    """
+    Список без параметров отдаётся готовым снимком JSON
+    с ETag и долгим Cache-Control, на If-None-Match отвечает 304.
+    """
+    snapshot_name = None
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params:
+            return super().list(request, *args, **kwargs)
+        return get_snapshot_response(request, self.snapshot_name)
+
+
+class ConditionalGetMixin:
+    """
+    ETag и Last-Modified для списка и страницы рецепта.
+    Считаются по MAX(updated_at) и числу рецептов выборки, версиям
+    тегов и ингредиентов и состоянию флагов пользователя;
+    совпавший If-None-Match даёт 304 без сериализации.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.conditional_response(
+            super().list, queryset, False, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        queryset = self.get_queryset()
+        queryset = queryset.filter(pk=pk) if pk.isdigit() else queryset.none()
+        return self.conditional_response(
+            super().retrieve, queryset, True, request, *args, **kwargs
+        )
+
+    def conditional_response(self, handler, queryset, detail,
+                             request, *args, **kwargs):
+        state = get_conditional_state(request, queryset, detail)
+        if state is None:
+            return handler(request, *args, **kwargs)
+        response = get_conditional_response(request, etag=state[0])
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        return add_conditional_headers(response, request, *state)
+
+
+def get_conditional_state(request, queryset, detail=False):
+    """
+    ETag и Last-Modified выборки рецептов или None,
+    если страницы рецепта нет.
+    Last-Modified только сообщается: If-Modified-Since
+    не учитывается, потому что флаги пользователя не меняют
+    updated_at, а правки внутри одной секунды не видны в HTTP-дате.
+    Проверка идёт по ETag, в который входят и версии тегов
+    и ингредиентов.
+    """
+    state = queryset.aggregate(
+        last_modified=Max('updated_at'), count=Count('pk')
+    )
+    if not state['count'] and detail:
+        return None
+    etag = quote_etag(get_digest(':'.join(map(str, (
+        state['last_modified'], state['count'],
+        *get_versions('tags', 'ingredients'),
+        *get_user_state(request.user), get_query_digest(request),
+    )))))
+    last_modified = (
+        state['last_modified']
+        and timegm(state['last_modified'].utctimetuple())
+    )
+    return etag, last_modified
+
+
+def add_conditional_headers(response, request, etag, last_modified):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        if request.user.is_authenticated:
+            patch_cache_control(response, no_cache=True, private=True)
+        else:
+            patch_cache_control(response, no_cache=True, public=True)
+        patch_vary_headers(response, ('Authorization',))
+    return response
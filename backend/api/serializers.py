@@ -1,19 +1,53 @@
 import base64
+from functools import cached_property
 
 from django.core.files.base import ContentFile
 from django.db import transaction
+from django.db.models import Exists, OuterRef, prefetch_related_objects
 from djoser.serializers import UserSerializer
+from rest_framework import serializers
+from rest_framework.relations import SlugRelatedField
+from rest_framework.serializers import ValidationError
 
+from api.caches import get_recipe_fragments
+from foodgram.dbrouters import from_primary
 from foodgram.settings import (MAX_COOKING_TIME, MAX_INGREDIENT_AMOUNT,
                                MIN_COOKING_TIME, MIN_INGREDIENT_AMOUNT)
 from recipes.models import (Favorite, Ingredient, IngredientAmount, Recipe,
                             ShoppingCart, Tag)
-from rest_framework import serializers
-from rest_framework.relations import SlugRelatedField
-from rest_framework.serializers import ValidationError
 from users.models import Subscribe, User
 
 
+FRAGMENT_PREFETCH = {
+    'author': 'author',
+    'tags': 'tags',
+    'ingredients': 'recipes__ingredient',
+}
+
+
+def get_sparse_fields(request, fields):
+    """
+    Поля ответа по ?fields= и ?omit= (через запятую или повтором
+    параметра) в порядке fields. Неизвестное поле — ошибка 400.
+    """
+    if request is None or not hasattr(request, 'query_params'):
+        return fields
+    selected, omitted = (
+        {name for value in request.query_params.getlist(param)
+         for name in value.split(',') if name}
+        for param in ('fields', 'omit')
+    )
+    unknown = (selected | omitted) - set(fields)
+    if unknown:
+        raise ValidationError({
+            'fields': f'Неизвестные поля: {", ".join(sorted(unknown))}'
+        })
+    return tuple(
+        name for name in fields
+        if (not selected or name in selected) and name not in omitted
+    )
+
+
 class Base64ImageField(serializers.ImageField):
     """Изображения."""
     def to_internal_value(self, data):
@@ -25,6 +59,14 @@ class Base64ImageField(serializers.ImageField):
         return super().to_internal_value(data)
 
 
+class AuthorSerializer(UserSerializer):
+    """Автор рецепта без данных о подписке."""
+
+    class Meta:
+        model = User
+        fields = ('id', 'email', 'username', 'first_name', 'last_name')
+
+
 class UserReadSerializer(UserSerializer):
     """Страница пользователя."""
     is_subscribed = serializers.SerializerMethodField()
@@ -35,8 +77,11 @@ class UserReadSerializer(UserSerializer):
                   'last_name', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
-        if request and request.user.is_authenticated:
+        # На себя подписаться нельзя: свой профиль без запроса
+        if request and request.user.is_authenticated and request.user != obj:
             return Subscribe.objects.filter(
                 user=request.user,
                 author=obj).exists()
@@ -68,13 +113,44 @@ class IngredientsInRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class IngredientField(serializers.PrimaryKeyRelatedField):
+    """Ингредиент из заранее выбранных списком, иначе запросом."""
+    ingredients = None
+
+    def to_internal_value(self, data):
+        if self.ingredients is None:
+            return super().to_internal_value(data)
+        ingredient = self.ingredients.get(str(data))
+        if ingredient is None:
+            return super().to_internal_value(data)
+        return ingredient
+
+
+class IngredientAmountListSerializer(serializers.ListSerializer):
+    """Все ингредиенты рецепта проверяются одним запросом."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            ids = {
+                str(item.get('id')) for item in data
+                if isinstance(item, dict)
+                and str(item.get('id')).isdigit()
+            }
+            self.child.fields['id'].ingredients = {
+                str(pk): ingredient for pk, ingredient
+                in Ingredient.objects.in_bulk(ids).items()
+            }
+        return super().to_internal_value(data)
+
+
 class IngredientInRecipeWriteSerializer(serializers.ModelSerializer):
     """Игредиенты в рецепте."""
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = IngredientField(queryset=Ingredient.objects.all())
 
     class Meta:
         model = IngredientAmount
         fields = ('id', 'amount')
+        list_serializer_class = IngredientAmountListSerializer
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -230,8 +306,39 @@ class RecipeShopSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'image', 'cooking_time')
 
 
+class RecipeFragmentSerializer(serializers.ModelSerializer):
+    """Часть рецепта, не зависящая от пользователя."""
+    tags = TagSerializer(
+        many=True,
+    )
+    ingredients = IngredientsInRecipeSerializer(
+        many=True,
+        source='recipes'
+    )
+    author = AuthorSerializer()
+
+    class Meta:
+        model = Recipe
+        fields = (
+            'id', 'tags', 'author', 'ingredients',
+            'name', 'image', 'text', 'cooking_time',
+        )
+
+
+class RecipeReadListSerializer(serializers.ListSerializer):
+    """Список рецептов: кэш фрагментов на всю страницу сразу."""
+
+    def to_representation(self, data):
+        recipes = data.all() if hasattr(data, 'all') else data
+        return self.child.represent_many(list(recipes))
+
+
 class RecipeReadSerializer(serializers.ModelSerializer):
-    """Просмотр рецепта."""
+    """
+    Просмотр рецепта.
+    Общая часть берётся из кэша фрагментов, флаги пользователя
+    считаются одним запросом на страницу.
+    """
     tags = TagSerializer(
         many=True,
     )
@@ -240,8 +347,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         source='recipes'
     )
     author = UserReadSerializer()
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
+    is_favorited = serializers.BooleanField(read_only=True)
+    is_in_shopping_cart = serializers.BooleanField(read_only=True)
 
     class Meta:
         model = Recipe
@@ -251,20 +358,93 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'name', 'image', 'text', 'cooking_time',
             'is_in_shopping_cart',
         )
+        list_serializer_class = RecipeReadListSerializer
 
-    def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        if request.user.is_anonymous:
-            return False
-        return Favorite.objects.filter(recipe=obj,
-                                       user=request.user).exists()
+    def to_representation(self, instance):
+        return self.represent_many([instance])[0]
 
-    def get_is_in_shopping_cart(self, obj):
+    @cached_property
+    def sparse_fields(self):
+        return get_sparse_fields(self.context.get('request'), self.Meta.fields)
+
+    @cached_property
+    def fragment_fields(self):
+        return tuple(
+            name for name in self.sparse_fields
+            if name in RecipeFragmentSerializer.Meta.fields
+        )
+
+    def represent_many(self, recipes):
+        """
+        Без ингредиентов, тегов или автора в ?fields= они не
+        загружаются, а без флагов не считаются и флаги.
+        """
+        fragments = get_recipe_fragments(
+            recipes, self.render_fragments, self.context.get('request'),
+            self.fragment_fields,
+        )
+        flags = {}
+        if {'author', 'is_favorited',
+                'is_in_shopping_cart'} & set(self.sparse_fields):
+            flags = self.get_user_flags(recipes)
+        return [
+            self.merge_user_flags(fragments[recipe.pk], flags.get(recipe.pk))
+            for recipe in recipes
+        ]
+
+    def render_fragments(self, recipes):
+        recipes = from_primary(recipes)
+        prefetch_related_objects(recipes, *(
+            lookup for name, lookup in FRAGMENT_PREFETCH.items()
+            if name in self.fragment_fields
+        ))
+        serializer = RecipeFragmentSerializer(context=self.context)
+        for name in set(serializer.fields) - set(self.fragment_fields):
+            del serializer.fields[name]
+        return {
+            recipe.pk: serializer.to_representation(recipe)
+            for recipe in recipes
+        }
+
+    def get_user_flags(self, recipes):
+        """Избранное, корзина и подписка на автора для всей страницы."""
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
-            return False
-        return ShoppingCart.objects.filter(recipe=obj,
-                                           user=request.user).exists()
+            return {}
+        user = request.user
+        return {
+            pk: flags
+            for pk, *flags in Recipe.objects.filter(
+                pk__in=[recipe.pk for recipe in recipes]
+            ).annotate(
+                is_favorited=Exists(Favorite.objects.filter(
+                    user=user, recipe=OuterRef('pk')
+                )),
+                is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                    user=user, recipe=OuterRef('pk')
+                )),
+                is_subscribed=Exists(Subscribe.objects.filter(
+                    user=user, author=OuterRef('author')
+                )),
+            ).order_by().values_list(
+                'pk', 'is_favorited', 'is_in_shopping_cart', 'is_subscribed'
+            )
+        }
+
+    def merge_user_flags(self, fragment, flags):
+        is_favorited, is_in_shopping_cart, is_subscribed = (
+            flags or (False, False, False)
+        )
+        data = {
+            **fragment,
+            'is_favorited': is_favorited,
+            'is_in_shopping_cart': is_in_shopping_cart,
+        }
+        if 'author' in fragment:
+            data['author'] = {
+                **fragment['author'], 'is_subscribed': is_subscribed
+            }
+        return {name: data[name] for name in self.sparse_fields}
 
 
 class SubscribeSerializer(serializers.ModelSerializer):
@@ -290,9 +470,13 @@ class SubscribeSerializer(serializers.ModelSerializer):
         )
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return Recipe.objects.filter(author=obj).count()
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         if (self.context.get('request')
            and not self.context['request'].user.is_anonymous):
             return Subscribe.objects.filter(user=self.context['request'].user,
@@ -302,10 +486,9 @@ class SubscribeSerializer(serializers.ModelSerializer):
     def get_recipes(self, obj):
         request = self.context.get('request')
         limit_recipes = request.query_params.get('recipes_limit')
+        recipes = obj.author.all()
         if limit_recipes is not None:
-            recipes = obj.author.all()[:(int(limit_recipes))]
-        else:
-            recipes = obj.favorite_recipes.all()
+            recipes = recipes[:(int(limit_recipes))]
         context = {'request': request}
         return RecipeShortSerializer(recipes, many=True,
                                      context=context).data
@@ -0,0 +1,191 @@
+import threading
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api.authentication import get_token_cache_key
+from api.caches import bump_versions, recipe_version
+from api.filters import TAG_CHOICES_CACHE_KEY
+from api.serializers import AuthorSerializer
+from api.snapshots import refresh_snapshots
+from recipes.models import (Ingredient, IngredientAmount, Recipe,
+                            RecipeChange, Tag)
+from users.models import User
+
+
+def bump_after_commit(*names):
+    """Смена версий кэша и файлов снимков после фиксации транзакции."""
+    transaction.on_commit(partial(refresh_snapshots, *names))
+
+
+pending = threading.local()
+
+
+class RecipeChanges(dict):
+    """Рецепты, изменённые в транзакции: id и признак удаления."""
+
+    def flush(self):
+        """
+        Журнал и updated_at пишутся одной вставкой и одним UPDATE
+        после фиксации, сколько бы строк рецепта ни менялось.
+        """
+        if getattr(pending, 'changes', None) is self:
+            del pending.changes
+        with transaction.atomic():
+            RecipeChange.objects.bulk_create(
+                RecipeChange(recipe_id=pk, deleted=deleted)
+                for pk, deleted in self.items()
+            )
+            Recipe.objects.filter(
+                pk__in=[pk for pk, deleted in self.items() if not deleted]
+            ).update(updated_at=timezone.now())
+        bump_versions('recipes', *map(recipe_version, self))
+
+
+def mark_changed(*pks, deleted=False):
+    """
+    Запись в журнал изменений для синхронизации клиентов
+    и отметка updated_at для ETag после фиксации транзакции.
+    """
+    if not pks:
+        return
+    changes = getattr(pending, 'changes', None)
+    connection = transaction.get_connection()
+    registered = changes is not None and any(
+        getattr(func, '__self__', None) is changes
+        for _, func, _ in connection.run_on_commit
+    )
+    if not registered:
+        changes = pending.changes = RecipeChanges()
+    for pk in pks:
+        changes[pk] = changes.get(pk, False) or deleted
+    if not registered:
+        transaction.on_commit(changes.flush)
+
+
+@receiver((post_save, pre_delete), sender=Tag)
+def reset_tag_choices(sender, instance, created=False, **kwargs):
+    """
+    Сброс кэша слагов тегов для фильтра рецептов после фиксации:
+    иначе запрос до неё закэширует слаги без нового тега.
+    Рецепты с тегом попадают в журнал изменений; при удалении
+    их список читается до того, как пропадут связи.
+    """
+    transaction.on_commit(partial(cache.delete, TAG_CHOICES_CACHE_KEY))
+    bump_after_commit('tags')
+    if not created:
+        mark_changed(*instance.recipes.values_list('pk', flat=True))
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(sender, instance, signal, created=False, **kwargs):
+    """Удаление ингредиента журнал ведёт ingredient_amount_changed."""
+    bump_after_commit('ingredients')
+    if signal is post_save and not created:
+        mark_changed(*instance.recipes.values_list('pk', flat=True))
+
+
+def is_cascade(origin):
+    """Удаление пришло каскадом от рецепта или пользователя."""
+    return (isinstance(origin, (Recipe, User))
+            or getattr(origin, 'model', None) in (Recipe, User))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(sender, instance, signal, **kwargs):
+    if signal is post_delete and instance.deleted_at is not None:
+        return
+    mark_changed(
+        instance.pk,
+        deleted=signal is post_delete or instance.deleted_at is not None,
+    )
+
+
+@receiver((post_save, post_delete), sender=IngredientAmount)
+def ingredient_amount_changed(sender, instance, origin=None, **kwargs):
+    """При удалении самого рецепта журнал ведёт recipe_changed."""
+    if is_cascade(origin):
+        return
+    mark_changed(instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        mark_changed(*pk_set or ())
+        bump_after_commit('tags')
+    else:
+        mark_changed(instance.pk)
+
+
+AUTHOR_FIELDS = tuple(
+    name for name in AuthorSerializer.Meta.fields if name != 'id'
+) + ('deleted_at',)
+
+
+def get_author_state(user):
+    return tuple(getattr(user, name) for name in AUTHOR_FIELDS)
+
+
+@receiver(pre_save, sender=User)
+def remember_author(sender, instance, update_fields, **kwargs):
+    """Профиль автора до сохранения: пароль и права рецепты не меняют."""
+    instance._author_state = None
+    if instance.pk is None or (
+        update_fields is not None
+        and not set(update_fields) & set(AUTHOR_FIELDS)
+    ):
+        return
+    instance._author_state = User.objects.filter(
+        pk=instance.pk
+    ).values_list(*AUTHOR_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, **kwargs):
+    """
+    Профиль автора входит в ответы с его рецептами.
+    Рецепты удалённого пользователя помечаются удалёнными вместе с ним.
+    """
+    state = getattr(instance, '_author_state', None)
+    if created or state in (None, get_author_state(instance)):
+        return
+    pks = list(
+        Recipe.objects.filter(author=instance).values_list('pk', flat=True)
+    )
+    if instance.deleted_at is not None:
+        Recipe.objects.filter(pk__in=pks).update(
+            deleted_at=instance.deleted_at
+        )
+    mark_changed(*pks, deleted=instance.deleted_at is not None)
+
+
+def forget_tokens(*keys):
+    """Сброс снимков токенов после фиксации транзакции."""
+    transaction.on_commit(partial(
+        cache.delete_many, [get_token_cache_key(key) for key in keys]
+    ))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """Выход через auth/token/logout и удаление пользователя."""
+    forget_tokens(instance.key)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, update_fields, **kwargs):
+    """Смена пароля, деактивация и правка профиля."""
+    if created or update_fields == frozenset(('last_login',)):
+        return
+    forget_tokens(*Token.objects.filter(user=instance)
+                  .values_list('key', flat=True))
@@ -0,0 +1,77 @@
+import hashlib
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+
+from django.core.cache import cache
+
+from api.caches import bump_versions, get_versions
+from api.renderers import FastJSONRenderer
+from api.serializers import IngredientSerializer, TagSerializer
+from foodgram.dbrouters import primary_reads
+from foodgram.settings import SNAPSHOT_CACHE_TIMEOUT, SNAPSHOT_ROOT
+from recipes.models import Ingredient, Tag
+
+SNAPSHOT_KEY = 'snapshot:{}:{}'
+
+SNAPSHOTS = {
+    'tags': (Tag, TagSerializer),
+    'ingredients': (Ingredient, IngredientSerializer),
+}
+
+_local_snapshots = {}
+
+
+def render_snapshot(name):
+    """Готовый JSON списка и ETag по его содержимому."""
+    model, serializer_class = SNAPSHOTS[name]
+    content = FastJSONRenderer().render(
+        serializer_class(model.objects.all(), many=True).data
+    )
+    return content, f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+
+
+def get_snapshot(name):
+    """
+    Снимок списка для текущей версии данных.
+    Пересобирается только после изменения тегов или ингредиентов,
+    в процессе держится копия, чтобы не гонять байты из кэша.
+    """
+    version, = get_versions(name)
+    local = _local_snapshots.get(name)
+    if local and local[0] == version:
+        return local[1]
+    key = SNAPSHOT_KEY.format(name, version)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        with primary_reads():
+            snapshot = render_snapshot(name)
+        cache.set(key, snapshot, SNAPSHOT_CACHE_TIMEOUT)
+    _local_snapshots[name] = (version, snapshot)
+    return snapshot
+
+
+def write_snapshot(name, create=False):
+    """
+    Файл снимка в SNAPSHOT_ROOT, который раздаёт nginx.
+    Без create обновляется только уже выложенный export_snapshots файл.
+    Подменяется атомарно: nginx не отдаст половину файла.
+    """
+    path = SNAPSHOT_ROOT / f'{name}.json'
+    if not create and not path.exists():
+        return None
+    content, etag = get_snapshot(name)
+    SNAPSHOT_ROOT.mkdir(parents=True, exist_ok=True)
+    with NamedTemporaryFile(dir=SNAPSHOT_ROOT, suffix='.tmp',
+                            delete=False) as file:
+        file.write(content)
+    Path(file.name).chmod(0o644)
+    Path(file.name).replace(path)
+    return path, etag, len(content)
+
+
+def refresh_snapshots(*names):
+    """Смена версий данных и перезапись файлов снимков для nginx."""
+    bump_versions(*names)
+    for name in names:
+        if name in SNAPSHOTS:
+            write_snapshot(name)
@@ -0,0 +1,1486 @@
+import json
+import os
+import pstats
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import (AsyncClient, SimpleTestCase, TestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from api.async_views import serialize
+from api.authentication import get_token_cache_key
+from api.filters import TAG_CHOICES_CACHE_KEY
+from api.metrics import QUERY_COUNT_BUCKETS, Registry, registry
+from api.middleware import RateLimiter
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer
+from api.serializers import RecipeReadSerializer
+from api.snapshots import get_snapshot, render_snapshot
+from foodgram.dbrouters import ReplicaRouter, read_from_replica
+from foodgram.settings import BASE_DIR, BATCH_IDS_LIMIT
+from recipes.models import (Favorite, Ingredient, IngredientAmount, Recipe,
+                            RecipeChange, ShoppingCart, Tag)
+from users.models import Subscribe, User
+
+SIZES = (5, 50)
+IMAGE = 'recipes/test.png'
+
+
+class ApiDataMixin:
+    """Пользователь с токеном и наращиваемые данные вокруг него."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='password',
+            first_name='Имя', last_name='Фамилия', is_staff=True,
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.anon = APIClient(HTTP_HOST='localhost')
+        self.auth = APIClient(HTTP_HOST='localhost')
+        self.auth.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.size = 0
+        caches['throttle'].clear()
+
+    def grow(self, size):
+        """Теги, ингредиенты, авторы с рецептами и связи пользователя."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_data(size)
+        self.size = size
+
+    def create_data(self, size):
+        for index in range(self.size, size):
+            tag = Tag.objects.create(
+                name=f'Тег {index}', color=f'#{index:06X}',
+                slug=f'tag-{index}',
+            )
+            ingredient = Ingredient.objects.create(
+                name=f'Ингредиент {index}', measurement_unit='г',
+            )
+            author = User.objects.create(
+                username=f'author-{index}', email=f'author-{index}@ex.com',
+                first_name='Автор', last_name=str(index),
+            )
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {index}', image=IMAGE,
+                text='Описание', cooking_time=10,
+            )
+            recipe.tags.set(Tag.objects.order_by('-pk')[:2])
+            IngredientAmount.objects.bulk_create(
+                IngredientAmount(recipe=recipe, ingredient=item, amount=10)
+                for item in Ingredient.objects.order_by('-pk')[:3]
+            )
+            own_recipe = Recipe.objects.create(
+                author=self.user, name=f'Мой рецепт {index}', image=IMAGE,
+                text='Описание', cooking_time=5,
+            )
+            own_recipe.tags.add(tag)
+            reader = User.objects.create(
+                username=f'reader-{index}', email=f'reader-{index}@ex.com',
+                first_name='Читатель', last_name=str(index),
+            )
+            Favorite.objects.create(user=self.user, recipe=recipe)
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+            Subscribe.objects.create(user=self.user, author=author)
+            self.tag = tag
+            self.ingredient = ingredient
+            self.recipe = recipe
+            self.author = author
+            self.own_recipe = own_recipe
+            self.reader = reader
+
+
+class QueryBudgetTest(ApiDataMixin, TestCase):
+    """
+    Число SQL-запросов каждого маршрута api/urls.py не зависит
+    от объёма данных и не превышает заявленного бюджета.
+    Данные наращиваются от SIZES[0] до SIZES[-1] объектов
+    каждого вида, страницы запрашиваются того же размера.
+    """
+
+    def assertQueryBudget(self, budget, method, url, client=None,
+                          status=200, **kwargs):
+        """
+        Данные откатываются после замера, запрос на каждом
+        размере видит данные без следов предыдущего.
+        url может содержать {size}, {tag}, {recipe}, {own_recipe}, {author},
+        {reader} и {ingredient}: они подставляются заново на каждом
+        размере данных. Рецепт own_recipe и пользователь reader
+        ещё не в избранном, корзине и подписках. data может быть
+        функцией от размера данных. Обработчики on_commit
+        выполняются и входят в замер.
+        """
+        client = client or self.auth
+        counts = []
+        start = self.size
+        with transaction.atomic():
+            for size in SIZES:
+                self.grow(size)
+                cache.clear()
+                caches['throttle'].clear()
+                path = url.format(
+                    size=size, tag=self.tag.pk, recipe=self.recipe.pk,
+                    own_recipe=self.own_recipe.pk, author=self.author.pk,
+                    reader=self.reader.pk, ingredient=self.ingredient.pk,
+                )
+                options = dict(kwargs)
+                if callable(options.get('data')):
+                    options['data'] = options['data'](size)
+                with transaction.atomic():
+                    with CaptureQueriesContext(connection) as context, \
+                            self.captureOnCommitCallbacks(execute=True):
+                        response = getattr(client, method)(path, **options)
+                    transaction.set_rollback(True)
+                self.assertEqual(response.status_code, status, path)
+                counts.append(len(context))
+            transaction.set_rollback(True)
+        self.size = start
+        queries = '\n'.join(query['sql'] for query in context.captured_queries)
+        self.assertEqual(
+            len(set(counts)), 1,
+            f'{method.upper()} {url}: запросов {counts} на размерах {SIZES}'
+            f'\n{queries}'
+        )
+        self.assertLessEqual(
+            counts[-1], budget,
+            f'{method.upper()} {url}: бюджет {budget}\n{queries}'
+        )
+
+    def test_api_root(self):
+        self.assertQueryBudget(0, 'get', '/api/', client=self.anon)
+
+    def test_tags(self):
+        self.assertQueryBudget(1, 'get', '/api/tags/', client=self.anon)
+        self.assertQueryBudget(1, 'get', '/api/tags/{tag}/', client=self.anon)
+
+    def test_ingredients(self):
+        self.assertQueryBudget(1, 'get', '/api/ingredients/',
+                               client=self.anon)
+        self.assertQueryBudget(1, 'get', '/api/ingredients/?name=Ин',
+                               client=self.anon)
+        self.assertQueryBudget(1, 'get', '/api/ingredients/{ingredient}/',
+                               client=self.anon)
+
+    def test_recipe_list_anonymous(self):
+        self.assertQueryBudget(8, 'get', '/api/recipes/?limit={size}',
+                               client=self.anon)
+
+    def test_recipe_list(self):
+        self.assertQueryBudget(11, 'get', '/api/recipes/?limit={size}')
+
+    def test_recipe_list_filters(self):
+        self.assertQueryBudget(
+            11, 'get',
+            '/api/recipes/?limit={size}&is_favorited=1&is_in_shopping_cart=1'
+            '&tags=tag-1&tags=tag-2&author={author}',
+        )
+
+    def test_recipe_list_sparse(self):
+        self.assertQueryBudget(
+            4, 'get', '/api/recipes/?limit={size}&fields=id,name,image',
+            client=self.anon,
+        )
+        self.assertQueryBudget(
+            9, 'get', '/api/recipes/?limit={size}&omit=ingredients,text'
+        )
+
+    def test_recipe_batch(self):
+        self.assertQueryBudget(
+            10, 'get', '/api/recipes/?ids={recipe},{own_recipe},999999'
+        )
+
+    def test_recipe_detail(self):
+        self.assertQueryBudget(10, 'get', '/api/recipes/{recipe}/')
+        self.assertQueryBudget(7, 'get', '/api/recipes/{recipe}/',
+                               client=self.anon)
+
+    @mock.patch('api.views.CHANGES_SETTLE_DELAY', 0)
+    def test_recipe_changes(self):
+        self.assertQueryBudget(8, 'get', '/api/recipes/changes/')
+
+    def test_download_shopping_cart(self):
+        self.assertQueryBudget(
+            2, 'get', '/api/recipes/download_shopping_cart/'
+        )
+
+    def test_favorite_and_shopping_cart(self):
+        for action in ('favorite', 'shopping_cart'):
+            self.assertQueryBudget(
+                8, 'post', f'/api/recipes/{{own_recipe}}/{action}/',
+                status=201,
+            )
+
+    def get_recipe_data(self, size):
+        """Рецепт с size ингредиентами."""
+        return {
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': 10}
+                for ingredient in Ingredient.objects.all()[:size]
+            ],
+            'tags': list(Tag.objects.values_list('pk', flat=True)[:2]),
+            'image': (
+                'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAAB'
+                'CAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5E'
+                'rkJggg=='
+            ),
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+        }
+
+    def test_recipe_create(self):
+        self.assertQueryBudget(
+            19, 'post', '/api/recipes/', format='json', status=201,
+            data=self.get_recipe_data,
+        )
+
+    def test_recipe_update(self):
+        self.assertQueryBudget(
+            25, 'put', '/api/recipes/{own_recipe}/', format='json',
+            data=self.get_recipe_data,
+        )
+        self.assertQueryBudget(
+            19, 'patch', '/api/recipes/{own_recipe}/', format='json',
+            data=lambda size: {
+                'ingredients': self.get_recipe_data(size)['ingredients'],
+            },
+        )
+
+    def test_recipe_delete(self):
+        self.assertQueryBudget(
+            8, 'delete', '/api/recipes/{own_recipe}/', status=204
+        )
+
+    def test_favorite_and_shopping_cart_delete(self):
+        for action in ('favorite', 'shopping_cart'):
+            self.assertQueryBudget(
+                4, 'delete', f'/api/recipes/{{recipe}}/{action}/',
+                status=204,
+            )
+
+    def test_user_list(self):
+        self.assertQueryBudget(3, 'get', '/api/users/?limit={size}')
+        self.assertQueryBudget(2, 'get', '/api/users/?limit={size}',
+                               client=self.anon)
+
+    def test_user_subscribed_flag(self):
+        self.grow(SIZES[0])
+        response = self.auth.get('/api/users/?limit=100')
+        users = {
+            user['id']: user['is_subscribed']
+            for user in response.json()['results']
+        }
+        self.assertTrue(users[self.author.pk])
+        self.assertFalse(users[self.reader.pk])
+        response = self.auth.get(f'/api/users/{self.author.pk}/')
+        self.assertTrue(response.json()['is_subscribed'])
+
+    def test_user_batch(self):
+        self.assertQueryBudget(
+            2, 'get', '/api/users/?ids={author},{reader}'
+        )
+
+    def test_user_detail(self):
+        self.assertQueryBudget(2, 'get', '/api/users/{author}/')
+        self.assertQueryBudget(1, 'get', '/api/users/me/')
+
+    def test_subscriptions(self):
+        self.assertQueryBudget(
+            4, 'get', '/api/users/subscriptions/?limit={size}'
+        )
+        self.assertQueryBudget(
+            4, 'get',
+            '/api/users/subscriptions/?limit={size}&recipes_limit=1'
+        )
+
+    def test_subscribe(self):
+        self.assertQueryBudget(
+            7, 'post', '/api/users/{reader}/subscribe/', status=201
+        )
+
+    def test_unsubscribe(self):
+        self.assertQueryBudget(
+            4, 'delete', '/api/users/{author}/subscribe/', status=204
+        )
+
+    def test_user_create(self):
+        self.assertQueryBudget(
+            5, 'post', '/api/users/', client=self.anon, status=201, data={
+                'email': 'new@example.com', 'username': 'new',
+                'first_name': 'Имя', 'last_name': 'Фамилия',
+                'password': 'Sup3r-secret',
+            },
+        )
+
+    def test_set_password(self):
+        self.assertQueryBudget(
+            4, 'post', '/api/users/set_password/', status=204, data={
+                'current_password': 'password',
+                'new_password': 'Sup3r-secret',
+            },
+        )
+
+    def test_token_logout(self):
+        self.assertQueryBudget(
+            3, 'post', '/api/auth/token/logout/', status=204
+        )
+
+    def test_metrics(self):
+        self.assertQueryBudget(1, 'get', '/api/metrics/')
+
+    def test_token_login(self):
+        self.assertQueryBudget(
+            4, 'post', '/api/auth/token/login/', client=self.anon,
+            data={'email': 'user@example.com', 'password': 'password'},
+        )
+
+
+class AsyncViewsTest(ApiDataMixin, TestCase):
+    """Асинхронные вьюхи ASGI-профиля отвечают так же, как вьюсеты."""
+    paths = (
+        '/api/recipes/',
+        '/api/recipes/?limit=3&page=2',
+        '/api/recipes/?tags=tag-1&is_favorited=1&author={author}',
+        '/api/recipes/?is_in_shopping_cart=1&limit=2',
+        '/api/recipes/?page=100',
+        '/api/recipes/?author=999999',
+        '/api/recipes/{recipe}/',
+        '/api/recipes/999999/',
+        '/api/recipes/?fields=id,name,image,is_favorited',
+        '/api/recipes/?omit=ingredients,text&omit=author',
+        '/api/ingredients/',
+        '/api/ingredients/?name=Ингредиент 1',
+        '/api/tags/',
+        '/api/tags/{tag}/',
+    )
+
+    async def get(self, path, **headers):
+        """Статус, тело и заголовки кэширования; ETag сверяется отдельно."""
+        cache.clear()
+        response = await AsyncClient().get(path, headers=headers)
+        return (
+            response.status_code, response.json(),
+            response.get('Last-Modified'), response.get('Cache-Control'),
+            'Authorization' in response.get('Vary', ''), 'ETag' in response,
+        )
+
+    async def test_same_output(self):
+        await sync_to_async(self.grow)(SIZES[0])
+        for path in self.paths:
+            path = path.format(
+                author=self.author.pk, recipe=self.recipe.pk, tag=self.tag.pk
+            )
+            for headers in ({}, {'Authorization': f'Token {self.token.key}'}):
+                with self.subTest(path=path, headers=headers):
+                    expected = await self.get(path, **headers)
+                    with override_settings(ROOT_URLCONF='foodgram.asgi_urls'):
+                        self.assertEqual(
+                            await self.get(path, **headers), expected
+                        )
+
+    async def test_conditional_get(self):
+        """304 по ETag и общий с вьюсетом кэш анонимных ответов."""
+        await sync_to_async(self.grow)(SIZES[0])
+        for path in ('/api/recipes/', f'/api/recipes/{self.recipe.pk}/'):
+            for headers in ({}, {'Authorization': f'Token {self.token.key}'}):
+                with self.subTest(path=path, headers=headers):
+                    cache.clear()
+                    client = AsyncClient()
+                    etag = (await client.get(path, headers=headers))['ETag']
+                    with override_settings(ROOT_URLCONF='foodgram.asgi_urls'):
+                        response = await client.get(path, headers={
+                            **headers, 'If-None-Match': etag,
+                        })
+                        self.assertEqual(response.status_code, 304)
+                        self.assertEqual(response['ETag'], etag)
+                        with mock.patch('api.async_views.serialize',
+                                        wraps=serialize) as rendered:
+                            await client.get(path, headers=headers)
+                    self.assertEqual(rendered.called, bool(headers))
+
+    async def test_invalid_token(self):
+        with override_settings(ROOT_URLCONF='foodgram.asgi_urls'):
+            response = await AsyncClient().get(
+                '/api/recipes/', headers={'Authorization': 'Token invalid'}
+            )
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+
+
+@mock.patch('api.middleware.DB_REPLICAS', ['default'])
+@mock.patch.object(ReplicaRouter, 'replicas', ['default'])
+class ReplicaRoutingTest(ApiDataMixin, TestCase):
+    """Чтение с реплик и закрепление за основной базой после записи."""
+
+    def setUp(self):
+        super().setUp()
+        self.grow(SIZES[0])
+        cache.clear()
+
+    def get_replica_reads(self, client, path):
+        with mock.patch.object(ReplicaRouter, 'get_replica',
+                               return_value='default') as get_replica:
+            self.assertEqual(client.get(path).status_code, 200)
+        return get_replica.call_count
+
+    def test_safe_requests_read_replica(self):
+        self.assertTrue(self.get_replica_reads(self.auth, '/api/recipes/'))
+        self.assertTrue(self.get_replica_reads(self.anon, '/api/users/'))
+
+    def test_write_pins_client_to_primary(self):
+        response = self.auth.post(
+            f'/api/recipes/{self.own_recipe.pk}/favorite/'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('db_primary', response.cookies)
+        self.assertFalse(self.get_replica_reads(self.auth, '/api/recipes/'))
+        client = APIClient(HTTP_HOST='localhost')
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertFalse(self.get_replica_reads(client, '/api/recipes/'))
+        self.assertTrue(self.get_replica_reads(self.anon, '/api/recipes/'))
+
+    def test_tokens_and_writes_use_primary(self):
+        router = ReplicaRouter()
+        token = read_from_replica.set(True)
+        try:
+            self.assertEqual(router.db_for_read(Token), 'default')
+            self.assertEqual(router.db_for_write(Recipe), 'default')
+        finally:
+            read_from_replica.reset(token)
+
+
+class CachedTokenTest(ApiDataMixin, TestCase):
+    """Снимок токена в кэше и его сброс."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def get_me(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.auth.get('/api/users/me/')
+        return response.status_code, len(context)
+
+    def test_token_cached(self):
+        self.assertEqual(self.get_me(), (200, 1))
+        self.assertEqual(self.get_me(), (200, 0))
+
+    def test_logout(self):
+        self.get_me()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.auth.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get_me()[0], 401)
+
+    def test_password_change(self):
+        self.get_me()
+        self.user.set_password('new-password')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertIsNone(cache.get(get_token_cache_key(self.token.key)))
+
+    def test_deactivation(self):
+        self.get_me()
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.get_me()[0], 401)
+
+
+@mock.patch.dict('api.throttling.THROTTLE_RATES', {
+    'shopping_cart': {'user': '2/min', 'ip': '4/min'},
+    'ingredient_search': {'ip': '1/min'},
+})
+class ThrottleTest(ApiDataMixin, TestCase):
+    """Лимиты дорогих маршрутов на пользователя и на адрес."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def assertThrottled(self, response):
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(0 < int(response['Retry-After']) <= 60)
+
+    def test_user_limit(self):
+        url = '/api/recipes/download_shopping_cart/'
+        for _ in range(2):
+            self.assertEqual(self.auth.get(url).status_code, 200)
+        self.assertThrottled(self.auth.get(url))
+        other = User.objects.create(username='other', email='o@ex.com')
+        client = APIClient(HTTP_HOST='localhost')
+        client.force_authenticate(other)
+        self.assertEqual(client.get(url).status_code, 200)
+        self.assertThrottled(client.get(url))
+        self.assertIn(
+            'foodgram_throttle_hits_total{kind="ip",scope="shopping_cart"}',
+            registry.render(),
+        )
+        self.assertIsNone(cache.get(
+            f'throttle:shopping_cart:user:{self.user.pk}:'
+            f'{int(time.time()) // 60}'
+        ))
+        caches['throttle'].clear()
+        self.assertEqual(self.auth.get(url).status_code, 200)
+
+    def test_ingredient_search(self):
+        self.assertEqual(self.anon.get('/api/ingredients/').status_code, 200)
+        self.assertEqual(self.anon.get('/api/ingredients/').status_code, 200)
+        url = '/api/ingredients/?name=Ин'
+        self.assertEqual(self.anon.get(url).status_code, 200)
+        self.assertThrottled(self.anon.get(url))
+        self.assertEqual(
+            self.anon.get(url, REMOTE_ADDR='10.0.0.1').status_code, 200
+        )
+
+    def test_forwarded_for(self):
+        """За nginx у каждого клиента свой лимит, подделка не помогает."""
+        url = '/api/ingredients/?name=Ин'
+        for address in ('203.0.113.1', '203.0.113.2'):
+            with self.subTest(address=address):
+                self.assertEqual(self.anon.get(
+                    url, HTTP_X_FORWARDED_FOR=address
+                ).status_code, 200)
+                self.assertThrottled(self.anon.get(
+                    url, HTTP_X_FORWARDED_FOR=f'198.51.100.9, {address}'
+                ))
+
+    async def test_async_ingredient_search(self):
+        url = '/api/ingredients/?name=Ин'
+        with override_settings(ROOT_URLCONF='foodgram.asgi_urls'):
+            client = AsyncClient()
+            self.assertEqual((await client.get(url)).status_code, 200)
+            self.assertThrottled(await client.get(url))
+
+
+class SparseFieldsTest(ApiDataMixin, TestCase):
+    """?fields= и ?omit= урезают ответ и работу с базой."""
+
+    def setUp(self):
+        super().setUp()
+        self.grow(SIZES[0])
+        cache.clear()
+
+    def test_fields(self):
+        response = self.auth.get(
+            '/api/recipes/?fields=name,id&fields=is_favorited'
+        )
+        self.assertEqual(response.status_code, 200)
+        for recipe in response.json()['results']:
+            self.assertEqual(list(recipe), ['id', 'is_favorited', 'name'])
+
+    def test_omit(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.auth.get(
+                f'/api/recipes/{self.recipe.pk}/?omit=ingredients,text'
+            )
+        recipe = response.json()
+        self.assertNotIn('text', recipe)
+        self.assertNotIn('ingredients', recipe)
+        self.assertTrue(recipe['author']['is_subscribed'])
+        queries = ' '.join(query['sql'] for query in context)
+        self.assertNotIn('"text"', queries)
+        self.assertNotIn('recipes_ingredientamount', queries)
+
+    def test_cached_fragments_keep_fields(self):
+        full = self.anon.get('/api/recipes/').json()['results'][0]
+        self.assertEqual(
+            self.anon.get('/api/recipes/?fields=id').json()['results'][0],
+            {'id': full['id']},
+        )
+
+    def test_unknown_field(self):
+        response = self.anon.get('/api/recipes/?fields=id,secret')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', response.json()['fields'])
+
+
+class BatchFetchTest(ApiDataMixin, TestCase):
+    """?ids= отдаёт несколько объектов за один запрос."""
+
+    def setUp(self):
+        super().setUp()
+        self.grow(SIZES[0])
+        cache.clear()
+
+    def test_recipes(self):
+        ids = [self.own_recipe.pk, 999999, self.recipe.pk, self.own_recipe.pk]
+        response = self.auth.get(
+            '/api/recipes/', {'ids': ','.join(map(str, ids))}
+        )
+        self.assertEqual(response.status_code, 200)
+        recipes = response.json()
+        self.assertEqual([recipe['id'] for recipe in recipes],
+                         [self.own_recipe.pk, self.recipe.pk])
+        self.assertEqual(
+            recipes[1],
+            self.auth.get(f'/api/recipes/{self.recipe.pk}/').json(),
+        )
+        self.assertTrue(recipes[1]['is_favorited'])
+        self.assertEqual(
+            self.anon.get('/api/recipes/', {'ids': self.recipe.pk}).json(),
+            [self.anon.get(f'/api/recipes/{self.recipe.pk}/').json()],
+        )
+
+    def test_users(self):
+        response = self.auth.get(
+            f'/api/users/?ids={self.reader.pk}&ids={self.author.pk}'
+        )
+        self.assertEqual(
+            [(user['id'], user['is_subscribed']) for user in response.json()],
+            [(self.reader.pk, False), (self.author.pk, True)],
+        )
+
+    def test_invalid(self):
+        too_many = ','.join(map(str, range(1, BATCH_IDS_LIMIT + 2)))
+        for url in ('/api/recipes/?ids=1,a', f'/api/users/?ids={too_many}',
+                    '/api/recipes/?ids=', '/api/users/?ids=,'):
+            with self.subTest(url=url):
+                response = self.anon.get(url)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('ids', response.json())
+
+
+class RecipeChangesTest(ApiDataMixin, TestCase):
+    """Журнал изменений для синхронизации клиентов."""
+
+    def setUp(self):
+        super().setUp()
+        self.grow(SIZES[0])
+        self.settle()
+
+    def settle(self, **lookups):
+        RecipeChange.objects.filter(**lookups).update(
+            created=timezone.now() - timedelta(minutes=1)
+        )
+
+    def test_changes(self):
+        response = self.auth.get('/api/recipes/changes/').json()
+        self.assertEqual(
+            {recipe['id'] for recipe in response['recipes']},
+            set(Recipe.objects.values_list('pk', flat=True)),
+        )
+        self.assertEqual(response['since'],
+                         str(RecipeChange.objects.latest('pk').pk))
+        self.assertEqual(
+            self.auth.get('/api/recipes/changes/',
+                          {'since': response['since']}).json()['recipes'],
+            [],
+        )
+
+    def test_recent_rows_held_back(self):
+        """
+        Запись с меньшим id, которую параллельная транзакция ещё
+        не зафиксировала, не теряется за записью с большим id.
+        """
+        since = str(RecipeChange.objects.latest('pk').pk)
+        pending = RecipeChange.objects.create(recipe_id=self.recipe.pk)
+        RecipeChange.objects.create(recipe_id=self.own_recipe.pk)
+        self.settle(pk__gt=pending.pk)
+        response = self.auth.get('/api/recipes/changes/',
+                                 {'since': since}).json()
+        self.assertEqual((response['since'], response['recipes']),
+                         (since, []))
+        self.settle(pk=pending.pk)
+        response = self.auth.get('/api/recipes/changes/',
+                                 {'since': since}).json()
+        self.assertEqual(
+            {recipe['id'] for recipe in response['recipes']},
+            {self.recipe.pk, self.own_recipe.pk},
+        )
+
+    def test_update_logged_once(self):
+        """Правка ингредиентов и тегов — одна запись и один UPDATE."""
+        ingredients = Ingredient.objects.all()[:5]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.auth.patch(
+                f'/api/recipes/{self.own_recipe.pk}/', format='json', data={
+                    'ingredients': [
+                        {'id': ingredient.pk, 'amount': 5}
+                        for ingredient in ingredients
+                    ],
+                    'tags': [self.tag.pk],
+                },
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            RecipeChange.objects.filter(
+                recipe_id=self.own_recipe.pk
+            ).count(),
+            2,
+        )
+
+    def test_tag_changes(self):
+        recipes = set(self.tag.recipes.values_list('pk', flat=True))
+        since = RecipeChange.objects.latest('pk').pk
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.name = 'Новое имя'
+            self.tag.save()
+        changes = RecipeChange.objects.filter(pk__gt=since)
+        self.assertEqual(
+            set(changes.values_list('recipe_id', flat=True)), recipes
+        )
+        since = RecipeChange.objects.latest('pk').pk
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.delete()
+        self.assertEqual(
+            set(changes.filter(pk__gt=since, deleted=False)
+                .values_list('recipe_id', flat=True)),
+            recipes,
+        )
+
+    def test_ingredient_changes(self):
+        recipes = set(IngredientAmount.objects.filter(
+            ingredient=self.ingredient
+        ).values_list('recipe_id', flat=True))
+        since = RecipeChange.objects.latest('pk').pk
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingredient.measurement_unit = 'кг'
+            self.ingredient.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='Соль', measurement_unit='г')
+        self.assertEqual(
+            set(RecipeChange.objects.filter(pk__gt=since)
+                .values_list('recipe_id', flat=True)),
+            recipes,
+        )
+
+    def test_author_changes(self):
+        """Рецепты автора меняются только вместе с его профилем."""
+        recipes = RecipeChange.objects.filter(
+            recipe_id__in=Recipe.objects.filter(author=self.author)
+        )
+        count = recipes.count()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.set_password('new-password')
+            self.author.is_staff = True
+            self.author.save()
+        self.assertEqual(recipes.count(), count)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.first_name = 'Новое имя'
+            self.author.save()
+        self.assertEqual(recipes.count(), count + 1)
+
+
+class ConditionalGetTest(ApiDataMixin, TestCase):
+    """ETag и Last-Modified на списке и странице рецепта."""
+
+    def setUp(self):
+        super().setUp()
+        self.grow(SIZES[0])
+        cache.clear()
+
+    def test_not_modified(self):
+        for url in ('/api/recipes/', f'/api/recipes/{self.recipe.pk}/'):
+            with self.subTest(url=url):
+                response = self.anon.get(url)
+                self.assertIn('Last-Modified', response)
+                self.assertEqual(
+                    self.anon.get(
+                        url, HTTP_IF_NONE_MATCH=response['ETag']
+                    ).status_code,
+                    304,
+                )
+
+    def test_tag_renamed(self):
+        """Переименованный тег виден по обоим заголовкам."""
+        url = f'/api/recipes/{self.recipe.pk}/'
+        response = self.anon.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.name = 'Новое имя'
+            self.tag.save()
+        for headers in (
+            {'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']},
+            {'HTTP_IF_NONE_MATCH': response['ETag']},
+        ):
+            with self.subTest(headers=headers):
+                response = self.anon.get(url, **headers)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('Новое имя', [
+                    tag['name'] for tag in response.json()['tags']
+                ])
+
+
+class TagChoicesTest(ApiDataMixin, TestCase):
+    """Кэш слагов тегов сбрасывается после фиксации транзакции."""
+
+    def test_new_tag_after_commit(self):
+        self.grow(SIZES[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Новый', color='#ABCDEF', slug='new')
+            # Запрос с другого соединения до фиксации тега не видит
+            cache.set(TAG_CHOICES_CACHE_KEY,
+                      list(Tag.objects.exclude(slug='new')
+                           .values_list('slug', 'name')))
+        response = self.anon.get('/api/recipes/', {'tags': 'new'})
+        self.assertEqual(response.status_code, 200)
+
+
+class RecipeFilterTest(ApiDataMixin, TestCase):
+    """Фильтры рецептов по ингредиентам, времени и тегам."""
+
+    def setUp(self):
+        super().setUp()
+        self.salt, self.sugar, self.flour = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Соль', 'Сахар', 'Мука')
+        )
+        self.breakfast, self.dinner = (
+            Tag.objects.create(name=slug, color=color, slug=slug)
+            for slug, color in (('breakfast', '#000001'),
+                                ('dinner', '#000002'))
+        )
+        self.first = self.create_recipe(
+            10, (self.salt, self.sugar), (self.breakfast,)
+        )
+        self.second = self.create_recipe(
+            30, (self.salt,), (self.breakfast, self.dinner)
+        )
+        self.third = self.create_recipe(
+            60, (self.sugar, self.flour), (self.dinner,)
+        )
+        cache.clear()
+
+    def create_recipe(self, cooking_time, ingredients, tags):
+        recipe = Recipe.objects.create(
+            author=self.user, name=f'Рецепт {cooking_time}', image=IMAGE,
+            text='Описание', cooking_time=cooking_time,
+        )
+        recipe.tags.set(tags)
+        for ingredient in ingredients:
+            IngredientAmount.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=1
+            )
+        return recipe
+
+    def get_ids(self, query):
+        response = self.anon.get(f'/api/recipes/?limit=100&{query}')
+        self.assertEqual(response.status_code, 200, query)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def assertFound(self, query, *recipes):
+        ids = self.get_ids(query)
+        self.assertEqual(len(ids), len(set(ids)), query)
+        self.assertEqual(set(ids), {recipe.pk for recipe in recipes}, query)
+
+    def test_all_ingredients(self):
+        salt, sugar = self.salt.pk, self.sugar.pk
+        for query in (f'ingredients={salt},{sugar}',
+                      f'ingredients={salt}&ingredients={sugar}'):
+            self.assertFound(query, self.first)
+        self.assertFound(f'ingredients={salt}', self.first, self.second)
+
+    def test_exclude_ingredients(self):
+        self.assertFound(f'exclude_ingredients={self.flour.pk}',
+                         self.first, self.second)
+        self.assertFound(
+            f'exclude_ingredients={self.sugar.pk}'
+            f'&exclude_ingredients={self.flour.pk}',
+            self.second,
+        )
+
+    def test_cooking_time(self):
+        self.assertFound('cooking_time_min=10&cooking_time_max=30',
+                         self.first, self.second)
+        self.assertFound('cooking_time_min=11', self.second, self.third)
+        self.assertFound('cooking_time_max=60',
+                         self.first, self.second, self.third)
+
+    def test_with_tags(self):
+        self.assertFound(
+            f'tags=breakfast&tags=dinner&ingredients={self.salt.pk}',
+            self.first, self.second,
+        )
+        self.assertFound(
+            f'tags=dinner&exclude_ingredients={self.flour.pk}'
+            '&cooking_time_max=30',
+            self.second,
+        )
+
+    def test_invalid(self):
+        for query in ('ingredients=a', f'ingredients={self.salt.pk},a',
+                      'exclude_ingredients=a', 'cooking_time_min=a',
+                      'cooking_time_max=a'):
+            with self.subTest(query=query):
+                response = self.anon.get(f'/api/recipes/?{query}')
+                self.assertEqual(response.status_code, 400)
+
+
+class AnonymousCacheTest(ApiDataMixin, TestCase):
+    """Ответы анониму берутся из кэша до изменения данных."""
+
+    def setUp(self):
+        super().setUp()
+        self.grow(SIZES[0])
+        cache.clear()
+        self.list_url = '/api/recipes/'
+        self.detail_url = f'/api/recipes/{self.recipe.pk}/'
+
+    def assertCached(self, url):
+        self.anon.get(url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.anon.get(url)
+        self.assertEqual(response.status_code, 200)
+        # Остаётся только агрегат для ETag, сам ответ из кэша
+        self.assertEqual(len(context), 1)
+        self.assertIn('MAX(', context.captured_queries[0]['sql'])
+        return response.json()
+
+    def get_detail(self):
+        return self.anon.get(self.detail_url).json()
+
+    def test_cache_hit(self):
+        for url in (self.list_url, self.detail_url):
+            with self.subTest(url=url):
+                self.assertCached(url)
+
+    def test_user_not_cached(self):
+        self.auth.get(self.list_url)
+        with CaptureQueriesContext(connection) as context:
+            self.auth.get(self.list_url)
+        self.assertTrue(context.captured_queries)
+
+    def test_recipe_changed(self):
+        self.assertCached(self.list_url)
+        self.assertCached(self.detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.name = 'Новое название'
+            self.recipe.save()
+        self.assertIn('Новое название', [
+            recipe['name']
+            for recipe in self.anon.get(self.list_url).json()['results']
+        ])
+        self.assertEqual(self.get_detail()['name'], 'Новое название')
+
+    def test_tag_changed(self):
+        self.assertCached(self.list_url)
+        self.assertCached(self.detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.name = 'Новый тег'
+            self.tag.save()
+        self.assertIn('Новый тег', [
+            tag['name']
+            for recipe in self.anon.get(self.list_url).json()['results']
+            for tag in recipe['tags']
+        ])
+        self.assertIn('Новый тег',
+                      [tag['name'] for tag in self.get_detail()['tags']])
+
+    def test_ingredient_changed(self):
+        self.assertCached(self.detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingredient.name = 'Новый ингредиент'
+            self.ingredient.save()
+        self.assertIn('Новый ингредиент', [
+            ingredient['name']
+            for ingredient in self.get_detail()['ingredients']
+        ])
+
+
+class FragmentCacheTest(ApiDataMixin, TestCase):
+    """Общая часть рецепта отрисовывается один раз до его изменения."""
+
+    def setUp(self):
+        super().setUp()
+        self.grow(SIZES[0])
+        cache.clear()
+
+    def get_rendered(self, client, url='/api/recipes/'):
+        """Id рецептов, отрисованных заново при запросе."""
+        render = RecipeReadSerializer.render_fragments
+        with mock.patch.object(
+            RecipeReadSerializer, 'render_fragments', autospec=True,
+            side_effect=render,
+        ) as mocked:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return {
+            recipe.pk
+            for call in mocked.call_args_list
+            for recipe in call.args[1]
+        }
+
+    def test_reuse(self):
+        page = {recipe['id'] for recipe
+                in self.auth.get('/api/recipes/').json()['results']}
+        self.assertEqual(self.get_rendered(self.auth), set())
+        self.assertEqual(self.get_rendered(self.anon), set())
+        self.assertEqual(
+            self.get_rendered(self.auth, f'/api/recipes/{self.recipe.pk}/'),
+            set(),
+        )
+        self.assertIn(self.recipe.pk, page)
+
+    def test_user_flags_not_cached(self):
+        self.auth.get('/api/recipes/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.filter(user=self.user).delete()
+        recipes = self.auth.get('/api/recipes/').json()['results']
+        self.assertFalse(any(recipe['is_favorited'] for recipe in recipes))
+
+    def test_recipe_changed(self):
+        self.auth.get('/api/recipes/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.name = 'Новое название'
+            self.recipe.save()
+        self.assertEqual(self.get_rendered(self.auth), {self.recipe.pk})
+        self.assertEqual(
+            self.auth.get(f'/api/recipes/{self.recipe.pk}/').json()['name'],
+            'Новое название',
+        )
+
+    def test_tag_changed(self):
+        self.auth.get('/api/recipes/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.name = 'Новый тег'
+            self.tag.save()
+        self.assertTrue(self.get_rendered(self.auth))
+
+
+class SnapshotTest(ApiDataMixin, TestCase):
+    """Снимки списков тегов и ингредиентов и их файлы для nginx."""
+
+    def setUp(self):
+        super().setUp()
+        self.grow(SIZES[0])
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name) / 'snapshots'
+        patcher = mock.patch('api.snapshots.SNAPSHOT_ROOT', self.root)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read(self, name):
+        return json.loads((self.root / f'{name}.json').read_bytes())
+
+    def test_render_snapshot(self):
+        content, etag = render_snapshot('tags')
+        self.assertEqual(json.loads(content),
+                         self.anon.get('/api/tags/?name=').json())
+        self.assertEqual(render_snapshot('tags'), (content, etag))
+
+    def test_get_snapshot(self):
+        snapshot = get_snapshot('ingredients')
+        with self.assertNumQueries(0):
+            self.assertEqual(get_snapshot('ingredients'), snapshot)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingredient.name = 'Новый ингредиент'
+            self.ingredient.save()
+        content, etag = get_snapshot('ingredients')
+        self.assertNotEqual(etag, snapshot[1])
+        self.assertIn('Новый ингредиент'.encode(), content)
+
+    def test_response(self):
+        response = self.anon.get('/api/tags/')
+        self.assertEqual(response.content, get_snapshot('tags')[0])
+        self.assertEqual(
+            self.anon.get(
+                '/api/tags/', HTTP_IF_NONE_MATCH=response['ETag']
+            ).status_code,
+            304,
+        )
+
+    def test_export(self):
+        call_command('export_snapshots', stdout=StringIO())
+        self.assertEqual(self.read('tags'),
+                         json.loads(get_snapshot('tags')[0]))
+        self.assertEqual(len(self.read('ingredients')), SIZES[0])
+        self.assertEqual(list(self.root.glob('*.tmp')), [])
+
+    def test_export_refreshed(self):
+        call_command('export_snapshots', stdout=StringIO())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.name = 'Новый тег'
+            self.tag.save()
+        self.assertIn('Новый тег',
+                      [tag['name'] for tag in self.read('tags')])
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='Соль', measurement_unit='г')
+        self.assertEqual(len(self.read('ingredients')), SIZES[0] + 1)
+
+    def test_not_exported(self):
+        """До export_snapshots файлы не появляются сами."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.name = 'Новый тег'
+            self.tag.save()
+        self.assertFalse(self.root.exists())
+
+
+class FastJSONTest(SimpleTestCase):
+    """orjson отдаёт тот же JSON, что и стандартный JSONRenderer."""
+    data = {
+        'name': 'Борщ\u2028',
+        'amount': Decimal('1.50'),
+        'created': datetime(2024, 1, 2, 3, 4, 5, 6000,
+                            tzinfo=dt_timezone.utc),
+        'tags': [1, None, True],
+        'nested': {1: 'один'},
+    }
+
+    def render(self, data):
+        return FastJSONRenderer().render(data, 'application/json')
+
+    def parse(self, content, **context):
+        return FastJSONParser().parse(BytesIO(content), None, context)
+
+    def test_same_output(self):
+        self.assertEqual(
+            self.render(self.data),
+            JSONRenderer().render(self.data, 'application/json'),
+        )
+
+    def test_decimal_and_datetime(self):
+        data = json.loads(self.render(self.data))
+        self.assertEqual(data['amount'], 1.5)
+        self.assertEqual(data['created'], '2024-01-02T03:04:05.006000Z')
+        self.assertNotIn('\u2028'.encode(), self.render(self.data))
+
+    def test_round_trip(self):
+        data = {'name': 'Борщ', 'ingredients': [{'id': 1, 'amount': 5}]}
+        self.assertEqual(self.parse(self.render(data)), data)
+
+    def test_parse_error(self):
+        with self.assertRaises(ParseError):
+            self.parse(b'{"name":')
+
+    def test_other_encoding(self):
+        self.assertEqual(
+            self.parse('{"name": "Борщ"}'.encode('cp1251'),
+                       encoding='cp1251'),
+            {'name': 'Борщ'},
+        )
+
+    def test_without_orjson(self):
+        expected = self.render(self.data)
+        with mock.patch('api.renderers.orjson', None), \
+                mock.patch('api.parsers.orjson', None):
+            self.assertEqual(self.render(self.data), expected)
+            self.assertEqual(self.parse(b'{"id": 1}'), {'id': 1})
+            with self.assertRaises(ParseError):
+                self.parse(b'{"name":')
+
+
+class MetricsTest(ApiDataMixin, TestCase):
+    """Метрики запросов по маршрутам и их экспорт."""
+
+    def setUp(self):
+        super().setUp()
+        self.grow(SIZES[0])
+        self.registry = Registry()
+        for path in ('api.middleware.registry', 'api.views.registry'):
+            patcher = mock.patch(path, self.registry)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get_labels(self, name):
+        counters, histograms = self.registry.collect()
+        return {
+            labels: value
+            for (metric, labels), value in {**counters, **histograms}.items()
+            if metric == name
+        }
+
+    def test_route_labels(self):
+        for pk in (self.recipe.pk, self.own_recipe.pk, 999999):
+            self.anon.get(f'/api/recipes/{pk}/')
+        self.anon.get('/api/no-such-page/123/')
+        self.assertEqual(self.get_labels('foodgram_http_requests_total'), {
+            (('method', 'GET'), ('route', 'api:recipe-detail'),
+             ('status', '200')): 2,
+            (('method', 'GET'), ('route', 'api:recipe-detail'),
+             ('status', '404')): 1,
+            (('method', 'GET'), ('route', 'unmatched'),
+             ('status', '404')): 1,
+        })
+        counters, histograms = self.registry.collect()
+        self.assertEqual(
+            {value for _, labels in [*counters, *histograms]
+             for label, value in labels if label == 'route'},
+            {'api:recipe-detail', 'unmatched'},
+        )
+
+    def test_histograms(self):
+        self.auth.get('/api/recipes/')
+        self.auth.get('/api/recipes/')
+        labels = (('method', 'GET'), ('route', 'api:recipe-list'))
+        duration = self.get_labels(
+            'foodgram_http_request_duration_seconds'
+        )[labels]
+        self.assertEqual(duration['count'], 2)
+        self.assertEqual(sum(duration['counts']), 2)
+        queries = self.get_labels('foodgram_db_queries_per_request')[labels]
+        self.assertEqual(queries['buckets'], list(QUERY_COUNT_BUCKETS))
+        self.assertEqual(
+            self.get_labels('foodgram_db_queries_total')[labels],
+            queries['sum'],
+        )
+        self.assertGreater(queries['sum'], 0)
+        self.assertIn(
+            'foodgram_http_request_duration_seconds_bucket{method="GET",'
+            'route="api:recipe-list",le="+Inf"} 2',
+            self.registry.render(),
+        )
+
+    def test_admin_only(self):
+        user = User.objects.create(username='other', email='o@ex.com')
+        client = APIClient(HTTP_HOST='localhost')
+        client.force_authenticate(user)
+        self.assertEqual(self.anon.get('/api/metrics/').status_code, 401)
+        self.assertEqual(client.get('/api/metrics/').status_code, 403)
+        response = self.auth.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn(
+            '# TYPE foodgram_http_requests_total counter',
+            response.content.decode(),
+        )
+
+    def test_multiprocess(self):
+        """Каждый воркер пишет свой файл, экспорт их складывает."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        labels = {'route': 'api:recipe-list', 'method': 'GET'}
+        workers = [Registry(directory.name) for _ in range(3)]
+        for pid, worker in enumerate(workers, start=1):
+            worker.inc('requests', labels, pid)
+            worker.observe('duration', labels, pid / 100)
+            with mock.patch('api.metrics.os.getpid', return_value=pid):
+                worker.flush(force=True)
+        self.assertEqual(
+            len(list(Path(directory.name).glob('*.json'))), 3
+        )
+        with mock.patch('api.metrics.os.getpid', return_value=1):
+            counters, histograms = workers[0].collect()
+        key = ('requests', (('method', 'GET'),
+                            ('route', 'api:recipe-list')))
+        self.assertEqual(counters, {key: 6})
+        histogram = histograms['duration', key[1]]
+        self.assertEqual(histogram['count'], 3)
+        self.assertAlmostEqual(histogram['sum'], 0.06)
+
+
+class SlowQueryLogTest(ApiDataMixin, TestCase):
+    """В логе медленных запросов нет значений параметров."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        for path, value in (
+            ('api.middleware.SLOW_QUERY_THRESHOLD', 0),
+            ('api.middleware.slow_query_limiter', RateLimiter(10 ** 6)),
+        ):
+            patcher = mock.patch(path, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_secrets_redacted(self):
+        with self.assertLogs('slow_queries', 'WARNING') as logs:
+            self.anon.post('/api/auth/token/login/', {
+                'email': self.user.email, 'password': 'password',
+            })
+            self.auth.get('/api/users/me/')
+        records = [json.loads(record.getMessage())
+                   for record in logs.records]
+        for secret in (self.token.key, self.user.email,
+                       self.user.password):
+            self.assertFalse(
+                [record for record in records if secret in str(record)],
+                secret,
+            )
+        user_queries = [record for record in records
+                        if 'users_user' in record['sql']]
+        self.assertTrue(user_queries)
+        for record in user_queries:
+            self.assertIsNone(record['plan'])
+        self.assertTrue(any(
+            record['params'] and 'str' in record['params']
+            for record in user_queries
+        ))
+
+
+class ProfilingTest(ApiDataMixin, TestCase):
+    """Профиль запроса по X-Profile пишется только для администратора."""
+
+    def setUp(self):
+        super().setUp()
+        self.grow(SIZES[0])
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        for path, value in (('api.middleware.PROFILING_ENABLED', True),
+                            ('api.middleware.PROFILE_DIR', self.root)):
+            patcher = mock.patch(path, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def profile(self, client, mode='all', **headers):
+        return client.get('/api/recipes/', HTTP_X_PROFILE=mode, **headers)
+
+    def test_cpu_and_memory(self):
+        response = self.profile(self.auth, HTTP_X_REQUEST_ID='req-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Profile-Id'], 'req-1')
+        stats = pstats.Stats(str(self.root / 'req-1.prof'))
+        self.assertTrue(any(
+            'views' in filename for filename, _, _ in stats.stats
+        ))
+        memory = (self.root / 'req-1.memory.txt').read_text()
+        self.assertTrue(memory.startswith('GET /api/recipes/\n'))
+        self.assertGreater(len(memory.splitlines()), 1)
+
+    def test_modes(self):
+        for mode, files in (('cpu', ['.prof']), ('memory', ['.memory.txt']),
+                            ('all', ['.memory.txt', '.prof'])):
+            with self.subTest(mode=mode):
+                request_id = self.profile(self.auth, mode)['X-Profile-Id']
+                self.assertEqual(
+                    sorted(path.name[len(request_id):] for path
+                           in self.root.glob(f'{request_id}.*')),
+                    files,
+                )
+
+    def test_query_param(self):
+        response = self.auth.get('/api/recipes/', {'_profile': 'cpu'})
+        self.assertTrue((self.root / f'{response["X-Profile-Id"]}.prof')
+                        .exists())
+
+    def test_unsafe_request_id(self):
+        response = self.profile(self.auth, HTTP_X_REQUEST_ID='../secret')
+        self.assertRegex(response['X-Profile-Id'], r'^[0-9a-f]{32}$')
+
+    def test_not_admin(self):
+        user = User.objects.create(username='other', email='o@ex.com')
+        token = Token.objects.create(user=user)
+        user_client = APIClient(HTTP_HOST='localhost')
+        user_client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        for client in (self.anon, user_client):
+            response = self.profile(client)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(list(self.root.iterdir()), [])
+
+    def test_disabled(self):
+        with mock.patch('api.middleware.PROFILING_ENABLED', False):
+            response = self.profile(self.auth)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(list(self.root.iterdir()), [])
+
+
+class BenchHttpTest(SimpleTestCase):
+    """bench_http: сценарии коллекции, JSON результатов и сравнение."""
+    collection = {
+        'variable': [{'key': 'limit', 'value': '6'}],
+        'item': [
+            {'name': 'recipes', 'item': [
+                {'name': 'list', 'request': {
+                    'method': 'GET',
+                    'url': {'raw': '{{baseUrl}}/api/recipes/?limit={{limit}}'},
+                }},
+                {'name': 'me', 'request': {
+                    'method': 'GET', 'url': '{{baseUrl}}/api/users/me/',
+                    'auth': {'type': 'apikey', 'apikey': [
+                        {'key': 'key', 'value': 'Authorization'},
+                        {'key': 'value', 'value': 'Token {{userToken}}'},
+                    ]},
+                }},
+                {'name': 'unknown', 'request': {
+                    'method': 'GET', 'url': '{{baseUrl}}/api/{{missing}}/',
+                }},
+                {'name': 'create', 'request': {
+                    'method': 'POST', 'url': '{{baseUrl}}/api/recipes/',
+                }},
+            ]},
+            {'name': 'bad_requests', 'item': [
+                {'name': 'not found', 'request': {
+                    'method': 'GET', 'url': '{{baseUrl}}/api/nothing/',
+                }},
+            ]},
+        ],
+    }
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        self.collection_path = self.root / 'collection.json'
+        self.collection_path.write_text(json.dumps(self.collection))
+        patcher = mock.patch(
+            'api.management.commands.bench_http.Command.discover',
+            return_value={'baseUrl': 'http://bench', 'userToken': 'abc'},
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def bench(self, latency, **options):
+        stdout = StringIO()
+        with mock.patch(
+            'api.management.commands.bench_http.Command.request',
+            return_value=(latency, 200),
+        ) as request:
+            call_command(
+                'bench_http', base_url='http://bench', requests=4,
+                warmup=1, concurrency=2,
+                collection=str(self.collection_path), stdout=stdout,
+                stderr=StringIO(), **options
+            )
+        return stdout.getvalue(), request
+
+    def test_output_and_compare(self):
+        output = self.root / 'before.json'
+        _, request = self.bench(0.01, output=str(output))
+        self.assertIn(
+            mock.call('http://bench/api/users/me/',
+                      {'Authorization': 'Token abc'}),
+            request.call_args_list,
+        )
+        results = json.loads(output.read_text())['results']
+        self.assertEqual(
+            [result['key'] for result in results],
+            ['list /api/recipes/?limit=6 anon', 'me /api/users/me/ auth'],
+        )
+        self.assertEqual(results[0]['count'], 4)
+        self.assertEqual(results[0]['statuses'], {'200': 4})
+        self.assertAlmostEqual(results[0]['p95'], 0.01)
+        report, _ = self.bench(0.02, compare=str(output))
+        self.assertEqual(report.count('p95 +100%'), 2)
+
+
+class AsgiSettingsTest(SimpleTestCase):
+    """Под ASGI постоянные соединения выключены при любом env_file."""
+
+    def get_conn_max_age(self, module):
+        result = subprocess.run(
+            [sys.executable, '-c',
+             f'import {module}\n'
+             'from django.conf import settings\n'
+             'print([database["CONN_MAX_AGE"]'
+             ' for database in settings.DATABASES.values()])'],
+            cwd=BASE_DIR, capture_output=True, text=True, check=True,
+            env={**os.environ, 'DB_CONN_MAX_AGE': '60',
+                 'DB_REPLICAS': 'replica:5432',
+                 'DB_ENGINE': 'django.db.backends.postgresql'},
+        )
+        return result.stdout.strip()
+
+    def test_asgi(self):
+        self.assertEqual(self.get_conn_max_age('foodgram.asgi'), '[0, 0]')
+
+    def test_wsgi(self):
+        self.assertEqual(self.get_conn_max_age('foodgram.wsgi'), '[60, 60]')
@@ -0,0 +1,92 @@
+from django.core.cache import caches
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import SimpleRateThrottle
+
+from api.metrics import registry
+from foodgram.settings import THROTTLE_RATES
+
+
+class CacheThrottle(SimpleRateThrottle):
+    """
+    Лимит запросов в фиксированном окне. Счётчик окна живёт в кэше
+    throttle и растёт через add и incr без гонки get/set истории
+    SimpleRateThrottle. Общим для всех воркеров он становится,
+    когда кэш throttle — Redis (THROTTLE_CACHE_LOCATION), где
+    add и incr атомарны; LocMemCache считает в каждом процессе.
+    Область берётся из throttle_scopes вьюсета по действию,
+    лимит — из THROTTLE_RATES по области и kind.
+    """
+    cache = caches['throttle']
+    cache_format = 'throttle:{scope}:{kind}:{ident}:{window}'
+    kind = None
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    def get_ident_for(self, request):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        scopes = getattr(view, 'throttle_scopes', {})
+        return self.allow_scope(
+            request, scopes.get(getattr(view, 'action', None))
+        )
+
+    def allow_scope(self, request, scope):
+        rate = THROTTLE_RATES.get(scope, {}).get(self.kind)
+        ident = self.get_ident_for(request)
+        if rate is None or ident is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(rate)
+        now = int(self.timer())
+        window = now // self.duration
+        key = self.cache_format.format(
+            scope=scope, kind=self.kind, ident=ident, window=window
+        )
+        self.cache.add(key, 0, self.duration)
+        try:
+            count = self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, 1, self.duration)
+            count = 1
+        if count <= self.num_requests:
+            return True
+        self.wait_seconds = self.duration * (window + 1) - now
+        registry.inc('foodgram_throttle_hits_total',
+                     {'scope': scope, 'kind': self.kind})
+        return False
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class UserCacheThrottle(CacheThrottle):
+    """Лимит на пользователя; анонимов ограничивает IPCacheThrottle."""
+    kind = 'user'
+
+    def get_ident_for(self, request):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return None
+
+
+class IPCacheThrottle(CacheThrottle):
+    """Лимит на адрес клиента с учётом NUM_PROXIES."""
+    kind = 'ip'
+
+    def get_ident_for(self, request):
+        return self.get_ident(request)
+
+
+THROTTLE_CLASSES = (UserCacheThrottle, IPCacheThrottle)
+
+
+def check_throttles(request, scope):
+    """Проверка лимитов вне вьюсетов, например в async_views."""
+    waits = [
+        throttle.wait() for throttle in
+        (throttle_class() for throttle_class in THROTTLE_CLASSES)
+        if not throttle.allow_scope(request, scope)
+    ]
+    if waits:
+        raise Throttled(max(waits))
@@ -1,41 +1,68 @@
+from datetime import timedelta
+from itertools import takewhile
+
+from api.metrics import registry
+from api.mixins import (AnonymousCacheMixin, BatchRetrieveMixin,
+                        ConditionalGetMixin, SnapshotListMixin)
 from api.paginations import RecipePagination
 from api.permissions import IsAuthorOrReadOnly
 from api.serializers import (IngredientSerializer, RecipeCreateSerializer,
                              RecipeReadSerializer,
                              RecipeShopSerializer, SubscribeSerializer,
                              TagSerializer,
-                             UserReadSerializer)
-from foodgram.settings import FILE_NAME, CONTENT_TYPE
-from django.db.models import Sum
+                             UserReadSerializer, get_sparse_fields)
+from api.throttling import THROTTLE_CLASSES
+from foodgram.settings import (CHANGES_PAGE_SIZE, CHANGES_SETTLE_DELAY,
+                               FILE_NAME, CONTENT_TYPE)
+from django.db.models import Count, Exists, OuterRef, Q, Sum, Value
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from recipes.models import (Favorite, Ingredient, IngredientAmount, Recipe,
-                            ShoppingCart, Tag)
+                            RecipeChange, ShoppingCart, Tag)
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter
-from rest_framework.permissions import (SAFE_METHODS, IsAuthenticated,
+from rest_framework.permissions import (SAFE_METHODS, IsAdminUser,
+                                        IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ReadOnlyModelViewSet
 from users.models import Subscribe, User
 
 from api.filters import IngredientFilter, RecipeFilter
 
 
-class CustomUserViewSet(UserViewSet):
+class CustomUserViewSet(BatchRetrieveMixin, UserViewSet):
     """Вьюсет для просмотра профиля и создания пользователя."""
-    queryset = User.objects.all()
+    queryset = User.objects.filter(deleted_at__isnull=True)
     permission_classes = [IsAuthenticatedOrReadOnly, ]
     pagination_class = RecipePagination
 
+    def get_queryset(self):
+        """Подписка на каждого пользователя — одним подзапросом."""
+        queryset = super().get_queryset()
+        if not self.request.user.is_authenticated:
+            return queryset.annotate(is_subscribed=Value(False))
+        return queryset.annotate(is_subscribed=Exists(
+            Subscribe.objects.filter(
+                user=self.request.user, author=OuterRef('pk')
+            )
+        ))
+
+    def perform_destroy(self, instance):
+        instance.mark_deleted()
+
     @action(detail=False, methods=('get',),
             pagination_class=None,
             permission_classes=(IsAuthenticated,))
     def me(self, request):
-        serializer = UserReadSerializer(request.user)
+        """Пользователь уже загружен аутентификацией, без повторной выборки."""
+        serializer = UserReadSerializer(
+            request.user, context=self.get_serializer_context()
+        )
         return Response(serializer.data,
                         status=status.HTTP_200_OK)
 
@@ -47,7 +74,7 @@ class CustomUserViewSet(UserViewSet):
     def subscribe(self, request, id=None):
         user = self.request.user
         try:
-            author = User.objects.get(pk=id)
+            author = User.objects.get(pk=id, deleted_at__isnull=True)
         except User.DoesNotExist:
             return Response({'errors': 'Пользователь не найден'},
                             status=status.HTTP_404_NOT_FOUND)
@@ -85,7 +112,15 @@ class CustomUserViewSet(UserViewSet):
         url_path='subscriptions'
     )
     def subscriptions(self, request):
-        queryset = User.objects.filter(subscribing__user=request.user)
+        queryset = User.objects.filter(
+            subscribing__user=request.user, deleted_at__isnull=True,
+        ).annotate(
+            recipes_count=Count(
+                'author', filter=Q(author__deleted_at__isnull=True),
+                distinct=True,
+            ),
+            is_subscribed=Value(True),
+        ).prefetch_related('author').order_by('id')
         pag_queryset = self.paginate_queryset(queryset)
         serializer = SubscribeSerializer(pag_queryset,
                                          many=True,
@@ -93,24 +128,34 @@ class CustomUserViewSet(UserViewSet):
         return self.get_paginated_response(serializer.data)
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(SnapshotListMixin, ReadOnlyModelViewSet):
     """Вьюсет для просмотра ингредиентов."""
+    snapshot_name = 'ingredients'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (SearchFilter,)
-    filterset_class = IngredientFilter
+    filter_backends = (IngredientFilter,)
     search_fields = ('^name',)
+    throttle_classes = THROTTLE_CLASSES
+    throttle_scopes = {'list': 'ingredient_search'}
 
+    def get_throttles(self):
+        """Полный список отдаётся снимком, лимит только на поиск."""
+        if IngredientFilter.search_param not in self.request.query_params:
+            return []
+        return super().get_throttles()
 
-class TagViewSet(ReadOnlyModelViewSet):
+
+class TagViewSet(SnapshotListMixin, ReadOnlyModelViewSet):
     """Вьюсет для просмотра тегов."""
+    snapshot_name = 'tags'
     http_method_names = ('get',)
     serializer_class = TagSerializer
     queryset = Tag.objects.all()
     pagination_class = None
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, AnonymousCacheMixin,
+                    BatchRetrieveMixin, viewsets.ModelViewSet):
     """Вьюсет рецепта.
        Просмотр, создание, редактирование."""
     queryset = Recipe.objects.all()
@@ -119,15 +164,66 @@ class RecipeViewSet(viewsets.ModelViewSet):
     pagination_class = RecipePagination
     filterset_class = RecipeFilter
     filter_backends = (DjangoFilterBackend,)
+    throttle_classes = THROTTLE_CLASSES
+    throttle_scopes = {
+        'create': 'recipe_create',
+        'download_shopping_cart': 'shopping_cart',
+    }
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def perform_destroy(self, instance):
+        instance.mark_deleted()
+
+    def get_queryset(self):
+        """Без text в ?fields= описание не читается из базы."""
+        queryset = super().get_queryset()
+        if self.request.method in SAFE_METHODS and 'text' not in (
+            get_sparse_fields(self.request, RecipeReadSerializer.Meta.fields)
+        ):
+            return queryset.defer('text')
+        return queryset
+
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeReadSerializer
         return RecipeCreateSerializer
 
+    @action(
+        detail=False,
+        methods=['get'],
+        pagination_class=None)
+    def changes(self, request):
+        """
+        Рецепты, изменённые после токена since, и id удалённых.
+        Токен следующего запроса возвращается в поле since.
+        Записи моложе CHANGES_SETTLE_DELAY не отдаются и токен
+        за них не переходит: id раздаются при вставке, и запись
+        с меньшим id может стать видна позже записи с большим.
+        """
+        since = request.query_params.get('since', '0')
+        if not since.isdigit():
+            return Response({'errors': 'Некорректный токен since'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        settled = timezone.now() - timedelta(seconds=CHANGES_SETTLE_DELAY)
+        rows = (
+            RecipeChange.objects.filter(pk__gt=since).order_by('pk')
+            .values_list('pk', 'recipe_id', 'created')[:CHANGES_PAGE_SIZE]
+        )
+        changes = list(takewhile(lambda row: row[2] <= settled, rows))
+        changed = {recipe_id for _, recipe_id, _ in changes}
+        recipes = list(self.get_queryset().filter(pk__in=changed))
+        serializer = RecipeReadSerializer(
+            recipes, many=True, context={'request': request}
+        )
+        return Response({
+            'since': str(changes[-1][0]) if changes else since,
+            'has_more': len(changes) == CHANGES_PAGE_SIZE,
+            'recipes': serializer.data,
+            'deleted': sorted(changed - {recipe.pk for recipe in recipes}),
+        })
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -209,7 +305,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def download_shopping_cart(self, request, **kwargs):
         ingredients = (
             IngredientAmount.objects.filter(
-
+                recipe__shopping_cart__user=request.user,
+                recipe__deleted_at__isnull=True,
             )
             .values('ingredient__name', 'ingredient__measurement_unit')
             .annotate(total_amount=Sum('amount'))
@@ -230,3 +327,14 @@ class RecipeViewSet(viewsets.ModelViewSet):
             filename={FILE_NAME}"
 
         return file
+
+
+class MetricsView(APIView):
+    """Метрики запросов и SQL в формате Prometheus."""
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return HttpResponse(
+            registry.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
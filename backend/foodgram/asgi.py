@@ -1,7 +1,17 @@
+"""
+ASGI-профиль: горячие GET-запросы рецептов, тегов и ингредиентов
+обслуживаются асинхронными вьюхами из api.async_urls.
+gunicorn foodgram.asgi -k uvicorn.workers.UvicornWorker
+"""
 import os
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+os.environ.setdefault('ROOT_URLCONF', 'foodgram.asgi_urls')
+# Асинхронный ORM ходит в БД из разных потоков: постоянные
+# соединения там не переиспользуются, а копятся. Значение
+# из env_file общее с WSGI, поэтому перекрывается, а не дополняется.
+os.environ['DB_CONN_MAX_AGE'] = '0'
 
 application = get_asgi_application()
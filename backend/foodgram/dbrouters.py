@@ -0,0 +1,67 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import DEFAULT_DB_ALIAS
+
+from foodgram.settings import DB_REPLICAS
+
+read_from_replica = ContextVar('read_from_replica', default=False)
+
+# Токены читаются с основной базы: сразу после входа
+# новый токен на реплике может ещё не появиться.
+PRIMARY_MODELS = {'authtoken.token'}
+
+
+@contextmanager
+def primary_reads():
+    """
+    Чтение с основной базы внутри блока. Нужно всему, что кладётся
+    в кэш под свежую версию: отставшая реплика закэшировала бы
+    старые данные под новым ключом.
+    """
+    token = read_from_replica.set(False)
+    try:
+        yield
+    finally:
+        read_from_replica.reset(token)
+
+
+def from_primary(instances):
+    """Объекты, прочитанные с реплики, заново с основной базы."""
+    if all(instance._state.db == DEFAULT_DB_ALIAS for instance in instances):
+        return instances
+    model = type(instances[0])
+    fresh = model._default_manager.using(DEFAULT_DB_ALIAS).in_bulk(
+        [instance.pk for instance in instances]
+    )
+    return [fresh.get(instance.pk, instance) for instance in instances]
+
+
+class ReplicaRouter:
+    """
+    Чтение с реплик, когда его разрешил ReplicaMiddleware,
+    запись и миграции только на основной базе.
+    """
+    replicas = DB_REPLICAS
+
+    def get_replica(self):
+        return random.choice(self.replicas)
+
+    def db_for_read(self, model, **hints):
+        if (not self.replicas or not read_from_replica.get()
+                or model._meta.label_lower in PRIMARY_MODELS):
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return self.get_replica()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
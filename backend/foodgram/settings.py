@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -35,6 +36,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.SlowQueryLogMiddleware',
+    'api.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -43,9 +47,10 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.ProfilingMiddleware',
 ]
 
-ROOT_URLCONF = 'foodgram.urls'
+ROOT_URLCONF = os.getenv('ROOT_URLCONF', 'foodgram.urls')
 
 TEMPLATES = [
     {
@@ -81,9 +86,58 @@ DATABASES = {
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT', 5432),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
+        # Пул соединений — pgbouncer; в режиме transaction
+        # он не держит серверные курсоры
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv('DB_DISABLE_SERVER_SIDE_CURSORS', 'False') == 'True',
+        'OPTIONS': {},
     }
 }
 
+# Реплики: DB_REPLICAS=host[:port],... для PostgreSQL
+# или пути к копиям файла для SQLite
+DB_REPLICAS = []
+for number, replica in enumerate(
+    filter(None, os.getenv('DB_REPLICAS', '').split(',')), start=1
+):
+    alias = f'replica_{number}'
+    DATABASES[alias] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    if DATABASES[alias]['ENGINE'].endswith('sqlite3'):
+        DATABASES[alias]['NAME'] = replica
+    else:
+        host, _, port = replica.partition(':')
+        DATABASES[alias]['HOST'] = host
+        DATABASES[alias]['PORT'] = port or DATABASES['default']['PORT']
+    DB_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['foodgram.dbrouters.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.getenv('DB_REPLICA_PIN_SECONDS', 10))
+
+# Счётчики лимитов запросов должны быть общими для всех воркеров:
+# без THROTTLE_CACHE_LOCATION (например, redis://redis:6379/1)
+# каждый процесс считает лимиты отдельно.
+THROTTLE_CACHE_LOCATION = os.getenv('THROTTLE_CACHE_LOCATION', '')
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    },
+    'throttle': {
+        'BACKEND': os.getenv(
+            'THROTTLE_CACHE_BACKEND',
+            'django.core.cache.backends.redis.RedisCache'
+            if THROTTLE_CACHE_LOCATION
+            else 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': THROTTLE_CACHE_LOCATION or 'throttle',
+    },
+}
+
 AUTH_USER_MODEL = 'users.User'
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -107,9 +161,20 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
     'SEARCH_PARAM': 'name',
+    # За nginx адрес клиента — последний в X-Forwarded-For
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 1)),
 }
 
 LANGUAGE_CODE = 'en-us'
@@ -122,10 +187,38 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'static/'
+SNAPSHOT_ROOT = STATIC_ROOT / 'snapshots'
 
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+MEDIA_GC_MIN_AGE = 60 * 60
+PURGE_BATCH_SIZE = 500
+INGREDIENT_IMPORT_BATCH_SIZE = 1000
+# Импорт без отчёта дольше этого считается прерванным
+INGREDIENT_IMPORT_STALE_AFTER = 60 * 5
+EXPORT_CHUNK_SIZE = 2000
+BATCH_IDS_LIMIT = int(os.getenv('BATCH_IDS_LIMIT', 100))
+THROTTLE_RATES = {
+    scope: {
+        kind: os.getenv(f'THROTTLE_{scope.upper()}_{kind.upper()}', rate)
+        for kind, rate in rates.items()
+    }
+    for scope, rates in {
+        'shopping_cart': {'user': '10/min', 'ip': '30/min'},
+        'recipe_create': {'user': '30/hour', 'ip': '60/hour'},
+        'ingredient_search': {'user': '120/min', 'ip': '300/min'},
+    }.items()
+}
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'recipes.storages.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -154,3 +247,52 @@ MIN_TIME_MODEL = 1
 FILE_NAME = 'shopping_cart.txt'
 CONTENT_TYPE = 'text/plain'
 PAGE_SIZE = 6
+CHANGES_PAGE_SIZE = 500
+# Свежие записи журнала ждут, пока зафиксируются параллельные транзакции
+CHANGES_SETTLE_DELAY = int(os.getenv('CHANGES_SETTLE_DELAY', 5))
+METRICS_DIR = os.getenv('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = 5
+SLOW_QUERY_THRESHOLD = float(os.getenv('SLOW_QUERY_THRESHOLD', 0.5))
+SLOW_QUERY_SAMPLE_RATE = float(os.getenv('SLOW_QUERY_SAMPLE_RATE', 1))
+SLOW_QUERY_RATE_LIMIT = int(os.getenv('SLOW_QUERY_RATE_LIMIT', 60))
+# EXPLAIN по этим таблицам подставляет в план токены, хеши паролей и почту
+SLOW_QUERY_NO_PLAN_TABLES = ('authtoken_token', 'users_user',
+                             'django_session')
+SLOW_QUERY_LOG_FILE = os.getenv('SLOW_QUERY_LOG_FILE')
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False') == 'True'
+PROFILE_DIR = Path(os.getenv('PROFILE_DIR', BASE_DIR / 'profiles'))
+PROFILE_TRACEMALLOC_FRAMES = 10
+PROFILE_MEMORY_TOP = 50
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'slow_queries': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': SLOW_QUERY_LOG_FILE,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'formatter': 'message',
+        } if SLOW_QUERY_LOG_FILE else {
+            'class': 'logging.StreamHandler',
+            'formatter': 'message',
+        },
+    },
+    'loggers': {
+        'slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+TAG_CHOICES_CACHE_TIMEOUT = 60 * 60
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 60 * 10))
+FRAGMENT_CACHE_TIMEOUT = int(os.getenv('FRAGMENT_CACHE_TIMEOUT', 60 * 60 * 24))
+SNAPSHOT_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+SNAPSHOT_MAX_AGE = int(os.getenv('SNAPSHOT_MAX_AGE', 60 * 60 * 24))
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', 60))
@@ -1,12 +1,40 @@
+import csv
+from functools import reduce
+from operator import or_
+
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.db.models import Count, Q
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
 from import_export.admin import ImportExportActionModelAdmin
+from import_export.formats.base_formats import CSV
+
+from foodgram.settings import EXPORT_CHUNK_SIZE
+from recipes.imports import get_progress, start_import
 from recipes.models import (Favorite, Ingredient, Recipe,
                             ShoppingCart, Tag, IngredientAmount)
+from recipes.resources import RecipesIngredient
 from users.models import Subscribe, User
 
 
+class Echo:
+    """Буфер csv.writer, который сразу отдаёт записанную строку."""
+
+    def write(self, value):
+        return value
+
+
 @admin.register(Ingredient)
 class IngredientAdmin(ImportExportActionModelAdmin):
+    """
+    Импорт ставится в очередь и идёт пачками в run_imports
+    (recipes/imports.py), страница импорта опрашивает его ход.
+    Экспорт в CSV отдаётся потоком.
+    """
+    resource_classes = (RecipesIngredient,)
     list_display = (
         'name',
         'measurement_unit'
@@ -14,6 +42,76 @@ class IngredientAdmin(ImportExportActionModelAdmin):
     search_fields = ('name',)
     list_filter = ('measurement_unit',)
 
+    def get_urls(self):
+        info = self.get_model_info()
+        return [
+            path(
+                'import/<int:import_id>/',
+                self.admin_site.admin_view(self.import_progress_view),
+                name='%s_%s_import_progress' % info,
+            ),
+        ] + super().get_urls()
+
+    def import_action(self, request, *args, **kwargs):
+        if not self.has_import_permission(request):
+            raise PermissionDenied
+        form = self.create_import_form(request)
+        if request.method != 'POST' or not form.is_valid():
+            return super().import_action(request, *args, **kwargs)
+        input_format = self.get_import_formats()[
+            int(form.cleaned_data['input_format'])
+        ]()
+        if not input_format.is_binary():
+            input_format.encoding = self.from_encoding
+        data = b''.join(form.cleaned_data['import_file'].chunks())
+        import_id = start_import(data, input_format)
+        return redirect(
+            'admin:%s_%s_import_progress' % self.get_model_info(),
+            import_id=import_id,
+        )
+
+    def import_progress_view(self, request, import_id):
+        if not self.has_import_permission(request):
+            raise PermissionDenied
+        progress = get_progress(import_id)
+        if progress is None:
+            raise Http404('Импорт не найден')
+        if request.GET.get('format') == 'json':
+            return JsonResponse(progress)
+        return TemplateResponse(
+            request, 'admin/recipes/ingredient/import_progress.html', {
+                **self.admin_site.each_context(request),
+                'title': 'Импорт ингредиентов',
+                'opts': self.model._meta,
+                'progress': progress,
+            }
+        )
+
+    def export_admin_action(self, request, queryset):
+        """CSV строится по мере отправки, остальные форматы — как было."""
+        formats = self.get_export_formats()
+        export_format = request.POST.get('file_format')
+        if not export_format or formats[int(export_format)] is not CSV:
+            return super().export_admin_action(request, queryset)
+        if not self.has_export_permission(request):
+            raise PermissionDenied
+        resource = RecipesIngredient()
+        fields = resource.get_export_fields()
+        writer = csv.writer(Echo())
+
+        def rows():
+            yield writer.writerow(resource.get_export_headers())
+            for obj in queryset.order_by('pk').iterator(EXPORT_CHUNK_SIZE):
+                yield writer.writerow([
+                    resource.export_field(field, obj) for field in fields
+                ])
+
+        response = StreamingHttpResponse(rows(), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="{}"'.format(
+            self.get_export_filename(request, queryset, CSV())
+        )
+        return response
+
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
@@ -26,22 +124,104 @@ class TagAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
 
 
+class InputFilter(admin.SimpleListFilter):
+    """
+    Фильтр с полем ввода: в отличие от фильтра по полю не выбирает
+    все различные значения столбца при каждом показе списка.
+    Значение ищется по любому из lookups через ИЛИ.
+    """
+    template = 'admin/input_filter.html'
+    fields = ()
+
+    def lookups(self, request, model_admin):
+        return (('', ''),)
+
+    def queryset(self, request, queryset):
+        value = (self.value() or '').strip()
+        if not value:
+            return queryset
+        return queryset.filter(reduce(or_, (
+            Q(**{field: value}) for field in self.fields
+        )))
+
+    def choices(self, changelist):
+        yield {
+            'parameter_name': self.parameter_name,
+            'value': self.value(),
+            'query_parts': [
+                (name, value) for name, value in changelist.params.items()
+                if name != self.parameter_name
+            ],
+        }
+
+
+class AuthorFilter(InputFilter):
+    title = 'автор (email или username)'
+    parameter_name = 'author'
+    fields = ('author__email__iexact', 'author__username__iexact')
+
+
+class NameFilter(InputFilter):
+    title = 'название'
+    parameter_name = 'name'
+    fields = ('name__icontains',)
+
+
+class EmailFilter(InputFilter):
+    title = 'email'
+    parameter_name = 'email'
+    fields = ('email__iexact',)
+
+
+class FirstNameFilter(InputFilter):
+    title = 'имя'
+    parameter_name = 'first_name'
+    fields = ('first_name__istartswith',)
+
+
+class DeferredDeleteMixin:
+    """
+    Удаление только помечает записи: каскад и файлы убирает
+    purge_deleted, поэтому страница подтверждения его не считает.
+    """
+
+    def delete_model(self, request, obj):
+        obj.mark_deleted()
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            obj.mark_deleted()
+
+    def get_deleted_objects(self, objs, request):
+        return (
+            [str(obj) for obj in objs],
+            {self.opts.verbose_name_plural: len(objs)},
+            set(),
+            [],
+        )
+
+
 class IngredientAmountAdmin(admin.TabularInline):
     model = IngredientAmount
     autocomplete_fields = ('ingredient', )
     extra = 1
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('ingredient')
+
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(DeferredDeleteMixin, admin.ModelAdmin):
     inlines = (IngredientAmountAdmin,)
     list_display = (
         'id',
         'name',
         'author',
         'pub_date',
+        'favorites_count',
         'text',
     )
+    list_select_related = ('author',)
     search_fields = (
         'author__username',
         'author__email',
@@ -50,9 +230,21 @@ class RecipeAdmin(admin.ModelAdmin):
     list_filter = (
         'tags',
         'pub_date',
-        'author',
-        'name',
+        AuthorFilter,
+        NameFilter,
     )
+    autocomplete_fields = ('author',)
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            favorites_count=Count('favorite_recipes', distinct=True)
+        )
+
+    @admin.display(description='В избранном',
+                   ordering='favorites_count')
+    def favorites_count(self, obj):
+        return obj.favorites_count
 
 
 @admin.register(Favorite)
@@ -62,12 +254,15 @@ class FavoriteAdmin(admin.ModelAdmin):
         'user',
         'recipe'
     )
+    list_select_related = ('user', 'recipe__author')
     search_fields = (
         'user__username',
         'user__email',
         'recipe__name'
     )
     list_filter = ('recipe__tags',)
+    autocomplete_fields = ('user', 'recipe')
+    show_full_result_count = False
 
 
 @admin.register(ShoppingCart)
@@ -77,12 +272,15 @@ class ShoppingCartAdmin(admin.ModelAdmin):
         'user',
         'recipe'
     )
+    list_select_related = ('user', 'recipe__author')
     search_fields = (
         'user__username',
         'user__email',
         'recipe__name'
     )
     list_filter = ('recipe__tags',)
+    autocomplete_fields = ('user', 'recipe')
+    show_full_result_count = False
 
     def favorited_count(self, obj):
         return obj.favorite_recipes.count()
@@ -97,6 +295,9 @@ class SubscribeAdmin(admin.ModelAdmin):
         'user',
         'author',
     )
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+    show_full_result_count = False
     search_fields = (
         'user__username',
         'user__email',
@@ -109,7 +310,7 @@ class SubscribeAdmin(admin.ModelAdmin):
     )
 
 
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(DeferredDeleteMixin, admin.ModelAdmin):
     list_display = (
         'id',
         'username',
@@ -124,8 +325,9 @@ class UserAdmin(admin.ModelAdmin):
         'first_name',
         'last_name'
     )
-    list_filter = ('date_joined', 'email', 'first_name')
+    list_filter = ('date_joined', EmailFilter, FirstNameFilter)
     empty_value_display = '-пусто-'
+    show_full_result_count = False
 
 
 admin.site.register(User, UserAdmin)
@@ -0,0 +1,132 @@
+import logging
+from datetime import timedelta
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+from import_export.formats import base_formats
+
+from api.snapshots import refresh_snapshots
+from foodgram.settings import (INGREDIENT_IMPORT_BATCH_SIZE,
+                               INGREDIENT_IMPORT_STALE_AFTER)
+from recipes.models import Ingredient, IngredientImport
+from recipes.resources import RecipesIngredient
+
+FIELDS = ('name', 'measurement_unit')
+MAX_LENGTH = {
+    name: Ingredient._meta.get_field(name).max_length for name in FIELDS
+}
+PROGRESS_FIELDS = ('status', 'total', 'processed', 'created', 'skipped',
+                   'error')
+STALE_ERROR = 'Обработчик импорта остановился, загрузите файл заново.'
+
+logger = logging.getLogger(__name__)
+
+
+def fail_stale_imports():
+    """
+    Импорты, обработчик которых давно не отчитывался, считаются
+    прерванными: воркер перезапущен или убит.
+    """
+    return IngredientImport.objects.filter(
+        status=IngredientImport.Status.RUNNING,
+        heartbeat__lt=timezone.now() - timedelta(
+            seconds=INGREDIENT_IMPORT_STALE_AFTER
+        ),
+    ).update(status=IngredientImport.Status.FAILED, error=STALE_ERROR,
+             data=b'')
+
+
+def get_progress(import_id):
+    fail_stale_imports()
+    return IngredientImport.objects.filter(
+        pk=import_id
+    ).values(*PROGRESS_FIELDS).first()
+
+
+def start_import(data, input_format):
+    """
+    Ставит файл в очередь run_imports. Возвращает id, по которому
+    get_progress отдаёт ход импорта.
+    """
+    return IngredientImport.objects.create(
+        data=data,
+        input_format=type(input_format).__name__,
+        encoding=getattr(input_format, 'encoding', None) or '',
+    ).pk
+
+
+def claim_import():
+    """Следующий импорт из очереди; параллельные обработчики не делят его."""
+    with transaction.atomic():
+        job = IngredientImport.objects.select_for_update(
+            skip_locked=True
+        ).filter(status=IngredientImport.Status.QUEUED).first()
+        if job is None:
+            return None
+        job.status = IngredientImport.Status.RUNNING
+        job.heartbeat = timezone.now()
+        job.save(update_fields=('status', 'heartbeat'))
+    return job
+
+
+def get_rows(dataset):
+    """Пары (название, единица) по заголовкам ресурса RecipesIngredient."""
+    fields = RecipesIngredient().fields
+    columns = [dataset.headers.index(fields[name].column_name)
+               for name in FIELDS]
+    for row in dataset:
+        yield tuple(str(row[column] or '').strip() for column in columns)
+
+
+def import_chunk(rows):
+    """
+    bulk_create новых ингредиентов пачки. Повторы внутри пачки
+    и уже существующие пары (name, measurement_unit) пропускаются.
+    """
+    rows = {
+        row for row in rows
+        if all(0 < len(value) <= MAX_LENGTH[name]
+               for name, value in zip(FIELDS, row))
+    }
+    rows -= set(Ingredient.objects.filter(
+        name__in={name for name, _ in rows}
+    ).values_list(*FIELDS))
+    Ingredient.objects.bulk_create(
+        Ingredient(name=name, measurement_unit=unit) for name, unit in rows
+    )
+    return len(rows)
+
+
+def save_progress(job, *fields):
+    job.heartbeat = timezone.now()
+    job.save(update_fields=(*fields, 'heartbeat'))
+
+
+def run_import(job):
+    """Импорт пачками с отчётом о ходе после каждой пачки."""
+    try:
+        input_format = getattr(base_formats, job.input_format)()
+        if job.encoding:
+            input_format.encoding = job.encoding
+        dataset = input_format.create_dataset(bytes(job.data))
+        job.total = len(dataset)
+        save_progress(job, 'total')
+        rows = get_rows(dataset)
+        while chunk := list(islice(rows, INGREDIENT_IMPORT_BATCH_SIZE)):
+            created = import_chunk(chunk)
+            job.processed += len(chunk)
+            job.created += created
+            job.skipped += len(chunk) - created
+            save_progress(job, 'processed', 'created', 'skipped')
+        job.status = IngredientImport.Status.DONE
+    except Exception as error:
+        logger.exception('Импорт ингредиентов %s не удался', job.pk)
+        job.status = IngredientImport.Status.FAILED
+        job.error = str(error)
+    finally:
+        if job.created:
+            refresh_snapshots('ingredients')
+        job.data = b''
+        save_progress(job, 'status', 'error', 'data')
+    return job
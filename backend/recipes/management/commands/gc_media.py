@@ -0,0 +1,47 @@
+import posixpath
+
+from django.core.management.base import BaseCommand
+
+from foodgram.settings import MEDIA_GC_MIN_AGE
+from recipes.models import Recipe
+from recipes.storages import delete_files
+
+
+def walk(storage, directory):
+    """Все файлы каталога хранилища с подкаталогами."""
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        yield from walk(storage, posixpath.join(directory, name))
+
+
+class Command(BaseCommand):
+    help = ('Удаляет из хранилища картинки рецептов, на которые '
+            'не ссылается ни один Recipe.image.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=MEDIA_GC_MIN_AGE,
+            help='Не трогать файлы моложе стольких секунд: рецепт '
+                 'с ними может быть ещё не сохранён.'
+        )
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        field = Recipe._meta.get_field('image')
+        directory = field.upload_to.rstrip('/')
+        if not field.storage.exists(directory):
+            return
+        referenced = set(
+            Recipe.all_objects.exclude(image='')
+            .values_list('image', flat=True)
+        )
+        count, size = delete_files(field.storage, [
+            name for name in walk(field.storage, directory)
+            if name not in referenced
+        ], options['min_age'], options['dry_run'])
+        self.stdout.write(
+            f'{"Будет удалено" if options["dry_run"] else "Удалено"} '
+            f'файлов: {count}, {size / 2 ** 20:.1f} МБ'
+        )
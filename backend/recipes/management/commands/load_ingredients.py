@@ -1,6 +1,7 @@
 import logging
 from csv import DictReader
 
+from api.snapshots import refresh_snapshots
 from django.core.management.base import BaseCommand
 from recipes.models import Ingredient
 
@@ -23,4 +24,5 @@ class Command(BaseCommand):
             count += 1
 
         Ingredient.objects.bulk_create(ingredient_list)
+        refresh_snapshots('ingredients')
         logger.info(f"Успешно загружено {count} кол-во ингредиентов")
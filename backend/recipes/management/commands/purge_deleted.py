@@ -0,0 +1,79 @@
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from foodgram.settings import MEDIA_GC_MIN_AGE, PURGE_BATCH_SIZE
+from recipes.models import Favorite, Recipe, ShoppingCart
+from recipes.storages import delete_files
+from users.models import Subscribe, User
+
+
+class Command(BaseCommand):
+    help = ('Удаляет помеченные рецепты и пользователей вместе со связями '
+            'короткими транзакциями, а картинки — после фиксации.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=PURGE_BATCH_SIZE)
+        parser.add_argument(
+            '--min-age', type=int, default=MEDIA_GC_MIN_AGE,
+            help='Картинки, менявшиеся позже, оставить для gc_media.'
+        )
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.min_age = options['min_age']
+        recipes = Recipe.all_objects.filter(deleted_at__isnull=False)
+        users = User.objects.filter(deleted_at__isnull=False)
+        for queryset in (
+            Favorite.objects.filter(Q(recipe__in=recipes) | Q(user__in=users)),
+            ShoppingCart.objects.filter(
+                Q(recipe__in=recipes) | Q(user__in=users)
+            ),
+            Subscribe.objects.filter(Q(user__in=users) | Q(author__in=users)),
+            Recipe.tags.through.objects.filter(recipe__in=recipes),
+        ):
+            self.report(queryset.model, self.delete_in_chunks(queryset))
+        # IngredientAmount удаляется каскадом внутри пачки рецептов
+        self.report(Recipe, self.delete_in_chunks(
+            recipes, on_commit=self.delete_images
+        ))
+        self.report(User, self.delete_in_chunks(users))
+
+    def report(self, model, count):
+        self.stdout.write(f'{model._meta.verbose_name_plural}: {count}')
+
+    def delete_in_chunks(self, queryset, on_commit=None):
+        """
+        Каждая пачка удаляется своей транзакцией, чтобы не держать
+        блокировки на всё время чистки большого пользователя.
+        """
+        model = queryset.model
+        manager = model._base_manager
+        total = 0
+        while True:
+            pks = list(queryset.values_list('pk', flat=True)
+                       .order_by('pk')[:self.batch_size])
+            if not pks:
+                return total
+            with transaction.atomic():
+                chunk = manager.filter(pk__in=pks)
+                if on_commit is not None:
+                    transaction.on_commit(partial(on_commit, list(chunk)))
+                chunk.delete()
+            total += len(pks)
+
+    def delete_images(self, recipes):
+        """Одинаковые картинки общие: удаляются только ничьи."""
+        names = {recipe.image.name for recipe in recipes if recipe.image}
+        names -= set(
+            Recipe.all_objects.filter(image__in=names)
+            .values_list('image', flat=True)
+        )
+        count, _ = delete_files(
+            Recipe._meta.get_field('image').storage, names, self.min_age
+        )
+        if count:
+            self.stdout.write(f'Картинок удалено: {count}')
@@ -0,0 +1,33 @@
+from time import sleep
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from recipes.imports import claim_import, fail_stale_imports, run_import
+
+
+class Command(BaseCommand):
+    help = ('Выполняет импорты ингредиентов, поставленные в очередь '
+            'из админки. С --loop ждёт новые, как отдельный воркер.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Не завершаться, когда очередь пуста.')
+        parser.add_argument('--interval', type=float, default=2,
+                            help='Пауза между проверками очереди, с.')
+
+    def handle(self, *args, **options):
+        while True:
+            failed = fail_stale_imports()
+            if failed:
+                self.stderr.write(f'Прерванных импортов: {failed}')
+            while job := claim_import():
+                job = run_import(job)
+                self.stdout.write(
+                    f'Импорт {job.pk}: {job.status}, добавлено '
+                    f'{job.created} из {job.processed}'
+                )
+            if not options['loop']:
+                return
+            close_old_connections()
+            sleep(options['interval'])
@@ -0,0 +1,208 @@
+import io
+import random
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+
+from api.filters import TAG_CHOICES_CACHE_KEY
+from api.snapshots import refresh_snapshots
+from recipes.models import (Favorite, Ingredient, IngredientAmount, Recipe,
+                            RecipeChange, ShoppingCart, Tag)
+from users.models import Subscribe, User
+
+SEED_IMAGE = 'recipes/seed.png'
+TAG_COLORS = (
+    '#E26C2D', '#49B64E', '#8775D2', '#F2C94C', '#2D9CDB',
+    '#EB5757', '#6FCF97', '#9B51E0', '#F2994A', '#56CCF2',
+)
+AMOUNTS = (1, 2, 3, 5, 10, 20, 50, 100, 150, 200, 250, 300, 500, 1000)
+
+
+def get_weights(count, exponent=1.0):
+    """Накопленные веса по закону Ципфа: первые элементы популярнее."""
+    return list(accumulate(1 / (rank + 1) ** exponent
+                           for rank in range(count)))
+
+
+def sample(population, weights, count):
+    """До count разных элементов с учётом весов."""
+    count = min(count, len(population))
+    chosen = {}
+    for _ in range(count * 3):
+        item = random.choices(population, cum_weights=weights)[0]
+        chosen[item.pk] = item
+        if len(chosen) == count:
+            break
+    return list(chosen.values())
+
+
+class Command(BaseCommand):
+    help = ('Быстро заполняет базу синтетическими пользователями, рецептами, '
+            'избранным, корзинами и подписками для нагрузочных замеров.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=len(TAG_COLORS))
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Среднее число избранных на пользователя.')
+        parser.add_argument('--carts', type=int, default=5,
+                            help='Среднее число рецептов в корзине.')
+        parser.add_argument('--subscriptions', type=int, default=10,
+                            help='Среднее число подписок на пользователя.')
+        parser.add_argument('--password', default='seed-password')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int,
+                            help='Зерно генератора для повторяемых данных.')
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        self.batch_size = options['batch_size']
+        ingredients = list(Ingredient.objects.order_by('?'))
+        if not ingredients:
+            raise CommandError(
+                'Нет ингредиентов: сначала выполните load_ingredients.'
+            )
+        with transaction.atomic():
+            tags = self.create_tags(options['tags'])
+            users = self.create_users(options['users'], options['password'])
+            if not users:
+                raise CommandError('Нужен хотя бы один пользователь.')
+            recipes = self.create_recipes(
+                options['recipes'], users, tags, ingredients
+            )
+            self.create_relations(
+                users, recipes, options['favorites'],
+                options['carts'], options['subscriptions']
+            )
+            RecipeChange.objects.bulk_create(
+                (RecipeChange(recipe_id=recipe.pk) for recipe in recipes),
+                batch_size=self.batch_size,
+            )
+            transaction.on_commit(self.reset_caches)
+
+    def reset_caches(self):
+        """Сигналы при bulk_create не срабатывают: версии меняются здесь."""
+        cache.delete(TAG_CHOICES_CACHE_KEY)
+        refresh_snapshots('recipes', 'tags')
+
+    def bulk_create(self, model, objects):
+        """bulk_create с возвратом созданных строк на любой СУБД."""
+        last = model.objects.order_by('-pk').values_list('pk', flat=True)
+        last_pk = last.first() or 0
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+        return list(model.objects.filter(pk__gt=last_pk).order_by('pk'))
+
+    def create_tags(self, count):
+        tags = list(Tag.objects.all())
+        start = len(tags)
+        for index in range(start, count):
+            color = (TAG_COLORS[index] if index < len(TAG_COLORS)
+                     else f'#{random.randrange(0x1000000):06X}')
+            if Tag.objects.filter(color=color).exists():
+                continue
+            tags.append(Tag.objects.create(
+                name=f'Тег {index + 1}', color=color, slug=f'tag-{index + 1}'
+            ))
+        self.stdout.write(f'Тегов: {len(tags)}')
+        return tags
+
+    def create_users(self, count, password):
+        password = make_password(password)
+        start = (User.objects.order_by('-pk')
+                 .values_list('pk', flat=True).first() or 0) + 1
+        users = self.bulk_create(User, (
+            User(
+                username=f'seed-user-{number}',
+                email=f'seed-user-{number}@example.com',
+                first_name=f'Имя{number}',
+                last_name=f'Фамилия{number}',
+                password=password,
+            )
+            for number in range(start, start + count)
+        ))
+        self.stdout.write(f'Пользователей: {len(users)}')
+        return users
+
+    def get_image(self):
+        """Хранилище по содержимому само не даст картинке задвоиться."""
+        content = io.BytesIO()
+        Image.new('RGB', (64, 64), '#E26C2D').save(content, 'PNG')
+        return default_storage.save(
+            SEED_IMAGE, ContentFile(content.getvalue())
+        )
+
+    def create_recipes(self, count, users, tags, ingredients):
+        """
+        Авторы и ингредиенты выбираются по Ципфу: немногие
+        авторы пишут большую часть рецептов, а соль и мука
+        встречаются чаще экзотики.
+        """
+        image = self.get_image()
+        author_weights = get_weights(len(users))
+        recipes = self.bulk_create(Recipe, (
+            Recipe(
+                author=random.choices(users, cum_weights=author_weights)[0],
+                name=f'Рецепт {number}',
+                image=image,
+                text=f'Описание рецепта {number}. ' * random.randint(1, 20),
+                cooking_time=random.choice((5, 10, 15, 20, 30, 45, 60, 90,
+                                            120, 180)),
+            )
+            for number in range(1, count + 1)
+        ))
+        ingredient_weights = get_weights(len(ingredients), 0.8)
+        IngredientAmount.objects.bulk_create((
+            IngredientAmount(
+                recipe=recipe, ingredient=ingredient,
+                amount=random.choice(AMOUNTS),
+            )
+            for recipe in recipes
+            for ingredient in sample(
+                ingredients, ingredient_weights,
+                max(1, round(random.gauss(8, 3))),
+            )
+        ), batch_size=self.batch_size)
+        if tags:
+            tag_weights = get_weights(len(tags))
+            Recipe.tags.through.objects.bulk_create((
+                Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag.pk)
+                for recipe in recipes
+                for tag in sample(tags, tag_weights, random.randint(1, 3))
+            ), batch_size=self.batch_size)
+        self.stdout.write(f'Рецептов: {len(recipes)}')
+        return recipes
+
+    def create_relations(self, users, recipes, favorites, carts,
+                         subscriptions):
+        """Избранное, корзины и подписки тяготеют к популярным рецептам."""
+        if not recipes:
+            return
+        recipe_weights = get_weights(len(recipes))
+        author_weights = get_weights(len(users))
+        for model, average in ((Favorite, favorites),
+                               (ShoppingCart, carts)):
+            model.objects.bulk_create((
+                model(user=user, recipe=recipe)
+                for user in users
+                for recipe in sample(recipes, recipe_weights,
+                                     random.randint(0, 2 * average))
+            ), batch_size=self.batch_size, ignore_conflicts=True)
+        Subscribe.objects.bulk_create((
+            Subscribe(user=user, author=author)
+            for user in users
+            for author in sample(users, author_weights,
+                                 random.randint(0, 2 * subscriptions))
+            if author != user
+        ), batch_size=self.batch_size, ignore_conflicts=True)
+        self.stdout.write(
+            f'Избранное: {Favorite.objects.count()}, '
+            f'корзины: {ShoppingCart.objects.count()}, '
+            f'подписки: {Subscribe.objects.count()}'
+        )
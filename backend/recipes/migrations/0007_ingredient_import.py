@@ -0,0 +1,34 @@
+# Generated by Django 4.2.9 on 2026-10-19 10:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_deleted_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngredientImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.BinaryField(verbose_name='Содержимое файла')),
+                ('input_format', models.CharField(max_length=20, verbose_name='Формат')),
+                ('encoding', models.CharField(blank=True, max_length=20, verbose_name='Кодировка')),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('done', 'Завершён'), ('failed', 'Ошибка')], db_index=True, default='queued', max_length=10, verbose_name='Статус')),
+                ('total', models.PositiveIntegerField(null=True, verbose_name='Строк в файле')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Обработано')),
+                ('created', models.PositiveIntegerField(default=0, verbose_name='Добавлено')),
+                ('skipped', models.PositiveIntegerField(default=0, verbose_name='Пропущено')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('heartbeat', models.DateTimeField(null=True, verbose_name='Последний отчёт обработчика')),
+            ],
+            options={
+                'verbose_name': 'Импорт ингредиентов',
+                'verbose_name_plural': 'Импорты ингредиентов',
+                'ordering': ('id',),
+            },
+        ),
+    ]
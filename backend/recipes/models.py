@@ -2,6 +2,7 @@ from colorfield.fields import ColorField
 from django.core import validators
 from django.core.validators import MinValueValidator, FileExtensionValidator
 from django.db import models
+from django.utils import timezone
 from users.models import User
 from foodgram.settings import MIN_AMOUNT_MODEL, MIN_TIME_MODEL
 
@@ -55,6 +56,13 @@ class Tag(models.Model):
         return self.name
 
 
+class AliveManager(models.Manager):
+    """Записи без пометки об удалении."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Recipe(models.Model):
     """Модель рецепта."""
     author = models.ForeignKey(
@@ -99,15 +107,39 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации рецепта',
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        db_index=True,
+        verbose_name='Дата изменения рецепта',
+    )
+    deleted_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True,
+        verbose_name='Дата удаления рецепта',
+    )
+
+    objects = AliveManager()
+    all_objects = models.Manager()
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=['cooking_time'],
+                         name='recipe_cooking_time_idx'),
+        ]
 
     def __str__(self):
         return f'Автор: {self.author.email} рецепт: {self.name}'
 
+    def mark_deleted(self):
+        """Строки и картинку позже удалит purge_deleted."""
+        self.deleted_at = timezone.now()
+        self.save(update_fields=('deleted_at',))
+
 
 class IngredientAmount(models.Model):
     recipe = models.ForeignKey(
@@ -131,6 +163,12 @@ class IngredientAmount(models.Model):
     class Meta:
         verbose_name = 'Количество ингредиента'
         verbose_name_plural = 'Количество ингредиентов'
+        indexes = [
+            models.Index(fields=['recipe', 'ingredient'],
+                         name='amount_recipe_ingredient_idx'),
+            models.Index(fields=['ingredient', 'recipe'],
+                         name='amount_ingredient_recipe_idx'),
+        ]
 
     def __str__(self):
         return (f'В рецепте {self.recipe.name} {self.amount} '
@@ -192,3 +230,89 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'Рецепт {self.recipe} в списке покупок у {self.user}'
+
+
+class RecipeChange(models.Model):
+    """Журнал изменений рецептов для синхронизации клиентов."""
+    recipe_id = models.PositiveBigIntegerField(
+        verbose_name='Рецепт',
+    )
+    deleted = models.BooleanField(
+        default=False,
+        verbose_name='Рецепт удалён',
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name='Дата изменения',
+    )
+
+    class Meta:
+        ordering = ('id',)
+        verbose_name = 'Изменение рецепта'
+        verbose_name_plural = 'Изменения рецептов'
+
+    def __str__(self):
+        return f'Изменение {self.id} рецепта {self.recipe_id}'
+
+
+class IngredientImport(models.Model):
+    """Импорт ингредиентов из админки, выполняет run_imports."""
+
+    class Status(models.TextChoices):
+        QUEUED = 'queued', 'В очереди'
+        RUNNING = 'running', 'Выполняется'
+        DONE = 'done', 'Завершён'
+        FAILED = 'failed', 'Ошибка'
+
+    data = models.BinaryField(
+        verbose_name='Содержимое файла',
+    )
+    input_format = models.CharField(
+        max_length=20,
+        verbose_name='Формат',
+    )
+    encoding = models.CharField(
+        max_length=20,
+        blank=True,
+        verbose_name='Кодировка',
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=Status.choices,
+        default=Status.QUEUED,
+        db_index=True,
+        verbose_name='Статус',
+    )
+    total = models.PositiveIntegerField(
+        null=True,
+        verbose_name='Строк в файле',
+    )
+    processed = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Обработано',
+    )
+    created = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Добавлено',
+    )
+    skipped = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Пропущено',
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name='Ошибка',
+    )
+    heartbeat = models.DateTimeField(
+        null=True,
+        verbose_name='Последний отчёт обработчика',
+    )
+
+    class Meta:
+        ordering = ('id',)
+        verbose_name = 'Импорт ингредиентов'
+        verbose_name_plural = 'Импорты ингредиентов'
+
+    def __str__(self):
+        return f'Импорт {self.id}: {self.status}'
@@ -0,0 +1,78 @@
+import hashlib
+import os
+import posixpath
+from datetime import timedelta
+from uuid import uuid4
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файлы хранятся по SHA-256 содержимого: recipes/ab/cdef….png.
+    Одинаковые загрузки ложатся в один файл, а содержимое по имени
+    никогда не меняется, поэтому его можно кэшировать навсегда.
+    Неиспользуемые файлы удаляет команда gc_media.
+    """
+
+    def get_content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(
+            posixpath.dirname(name), digest[:2], digest[2:] + extension
+        )
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        return super().save(
+            self.get_content_name(name, content), content, max_length
+        )
+
+    def get_available_name(self, name, max_length=None):
+        """Существующий файл с тем же именем — то же содержимое."""
+        if self.exists(name):
+            return name
+        return super().get_available_name(name, max_length)
+
+    def _save(self, name, content):
+        """
+        Повторная загрузка только обновляет время изменения, чтобы
+        gc_media не удалил файл до фиксации ссылающегося рецепта.
+        Новый файл пишется рядом и атомарно переименовывается:
+        параллельные загрузки одного содержимого не мешают друг другу.
+        """
+        path = self.path(name)
+        if os.path.exists(path):
+            os.utime(path)
+            return name
+        tmp_name = super()._save(f'{name}.{uuid4().hex}.tmp', content)
+        os.replace(self.path(tmp_name), path)
+        return name
+
+
+def delete_files(storage, names, min_age, dry_run=False):
+    """
+    Удаляет файлы, не менявшиеся min_age секунд: более свежий файл
+    могла только что переиспользовать новая загрузка.
+    Возвращает число и объём удалённых файлов.
+    """
+    deadline = timezone.now() - timedelta(seconds=min_age)
+    count = size = 0
+    for name in names:
+        if (not storage.exists(name)
+                or storage.get_modified_time(name) > deadline):
+            continue
+        count += 1
+        size += storage.size(name)
+        if not dry_run:
+            storage.delete(name)
+    return count, size
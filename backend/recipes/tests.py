@@ -0,0 +1,362 @@
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib import admin
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from import_export.formats.base_formats import CSV
+
+from recipes.imports import STALE_ERROR
+from recipes.models import (Favorite, IngredientAmount, Ingredient,
+                            IngredientImport, Recipe, RecipeChange,
+                            ShoppingCart, Tag)
+from recipes.storages import ContentAddressedStorage
+from users.models import Subscribe, User
+
+
+class ContentAddressedStorageTest(TestCase):
+    """Картинки рецептов хранятся по хешу содержимого."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        self.storage = ContentAddressedStorage(location=self.root)
+
+    def test_same_content_same_file(self):
+        first = self.storage.save('recipes/temp.png', ContentFile(b'image'))
+        second = self.storage.save('recipes/other.PNG', ContentFile(b'image'))
+        self.assertEqual(first, second)
+        self.assertRegex(first, r'^recipes/[0-9a-f]{2}/[0-9a-f]{62}\.png$')
+        self.assertEqual(self.storage.open(first).read(), b'image')
+        files = [name for _, _, names in os.walk(self.root) for name in names]
+        self.assertEqual(len(files), 1)
+
+    def test_different_content(self):
+        self.assertNotEqual(
+            self.storage.save('recipes/temp.png', ContentFile(b'first')),
+            self.storage.save('recipes/temp.png', ContentFile(b'second')),
+        )
+
+    def test_gc_media(self):
+        author = User.objects.create(username='author', email='a@ex.com')
+        with override_settings(MEDIA_ROOT=self.root):
+            recipe = Recipe.objects.create(
+                author=author, name='Рецепт', text='Описание',
+                cooking_time=10,
+                image=ContentFile(b'kept', name='temp.png'),
+            )
+            orphan = recipe.image.storage.save(
+                'recipes/temp.png', ContentFile(b'orphan')
+            )
+            call_command('gc_media', min_age=3600, stdout=StringIO())
+            self.assertTrue(recipe.image.storage.exists(orphan))
+            call_command('gc_media', min_age=0, stdout=StringIO())
+            self.assertFalse(recipe.image.storage.exists(orphan))
+            self.assertTrue(recipe.image.storage.exists(recipe.image.name))
+
+
+class DeferredDeleteTest(TestCase):
+    """Удаление помечает строки, purge_deleted их вычищает."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.author = User.objects.create_user(
+            username='author', email='author@ex.com', password='password',
+        )
+        self.reader = User.objects.create(username='reader',
+                                          email='reader@ex.com')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_recipes()
+        self.client = APIClient(HTTP_HOST='localhost')
+        token = Token.objects.create(user=self.author)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def create_recipes(self):
+        ingredient = Ingredient.objects.create(name='Соль',
+                                               measurement_unit='г')
+        self.recipes = [
+            Recipe.objects.create(
+                author=self.author, name=f'Рецепт {index}', text='Описание',
+                cooking_time=10,
+                image=ContentFile(f'image {index}'.encode(), name='temp.png'),
+            )
+            for index in range(2)
+        ]
+        for recipe in self.recipes:
+            IngredientAmount.objects.create(recipe=recipe,
+                                            ingredient=ingredient)
+            Favorite.objects.create(user=self.reader, recipe=recipe)
+            ShoppingCart.objects.create(user=self.reader, recipe=recipe)
+        Subscribe.objects.create(user=self.reader, author=self.author)
+
+    def purge(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('purge_deleted', min_age=0, stdout=StringIO())
+
+    def test_recipe_delete(self):
+        recipe, kept = self.recipes
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertTrue(Favorite.objects.filter(recipe=recipe).exists())
+        self.assertFalse(Recipe.objects.filter(pk=recipe.pk).exists())
+        self.assertEqual(
+            self.client.get(f'/api/recipes/{recipe.pk}/').status_code, 404
+        )
+        with mock.patch('api.views.CHANGES_SETTLE_DELAY', 0):
+            changes = self.client.get('/api/recipes/changes/').json()
+        self.assertEqual(changes['deleted'], [recipe.pk])
+        self.purge()
+        self.assertFalse(Recipe.all_objects.filter(pk=recipe.pk).exists())
+        self.assertFalse(Favorite.objects.filter(recipe=recipe).exists())
+        self.assertFalse(recipe.image.storage.exists(recipe.image.name))
+        self.assertTrue(Recipe.objects.filter(pk=kept.pk).exists())
+        self.assertTrue(kept.image.storage.exists(kept.image.name))
+
+    def test_user_delete(self):
+        response = self.client.delete(
+            f'/api/users/{self.author.pk}/',
+            {'current_password': 'password'}, format='json',
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Recipe.objects.exists())
+        self.assertEqual(
+            self.client.get(f'/api/users/{self.author.pk}/').status_code, 404
+        )
+        self.purge()
+        self.assertFalse(User.objects.filter(pk=self.author.pk).exists())
+        self.assertFalse(Recipe.all_objects.exists())
+        self.assertFalse(ShoppingCart.objects.exists())
+        self.assertFalse(Subscribe.objects.exists())
+        self.assertFalse(IngredientAmount.objects.exists())
+
+    def test_user_delete_frees_credentials(self):
+        """Почта и имя удалённого пользователя свободны сразу."""
+        email, username = self.author.email, self.author.username
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(
+                f'/api/users/{self.author.pk}/',
+                {'current_password': 'password'}, format='json',
+            )
+        deleted = User.objects.get(pk=self.author.pk)
+        self.assertEqual(deleted.email, f'{email}#deleted-{deleted.pk}')
+        self.assertIsNotNone(deleted.deleted_at)
+        response = APIClient(HTTP_HOST='localhost').post('/api/users/', {
+            'email': email, 'username': username, 'first_name': 'Имя',
+            'last_name': 'Фамилия', 'password': 'Secret-password-1',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(
+            User.objects.get(email=email).pk, response.json()['id']
+        )
+        self.purge()
+        self.assertFalse(User.objects.filter(pk=deleted.pk).exists())
+        self.assertTrue(User.objects.filter(email=email).exists())
+
+
+class AdminQueryCountTest(TestCase):
+    """Число запросов списков админки не зависит от числа строк."""
+    sizes = (5, 50)
+    pages = {
+        '/admin/recipes/recipe/': 5,
+        '/admin/recipes/recipe/?author=author-1@ex.com&name=1': 5,
+        '/admin/recipes/favorite/': 5,
+        '/admin/recipes/shoppingcart/': 5,
+        '/admin/users/subscribe/': 4,
+        '/admin/users/user/': 4,
+        '/admin/users/user/?email=author-1@ex.com&first_name=А': 4,
+    }
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='admin', email='admin@ex.com', password='password',
+        )
+        self.client.force_login(self.admin)
+        self.tag = Tag.objects.create(name='Тег', color='#000000',
+                                      slug='tag')
+        self.size = 0
+
+    def grow(self, size):
+        for index in range(self.size, size):
+            author = User.objects.create(
+                username=f'author-{index}', email=f'author-{index}@ex.com',
+                first_name='Автор',
+            )
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {index}', image='recipes/x.png',
+                text='Описание', cooking_time=10,
+            )
+            recipe.tags.add(self.tag)
+            Favorite.objects.create(user=author, recipe=recipe)
+            ShoppingCart.objects.create(user=author, recipe=recipe)
+            Subscribe.objects.create(user=self.admin, author=author)
+        self.size = size
+
+    def test_changelists(self):
+        counts = {}
+        for size in self.sizes:
+            self.grow(size)
+            for url in self.pages:
+                with CaptureQueriesContext(connection) as context:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200, url)
+                counts.setdefault(url, []).append(len(context))
+        for url, budget in self.pages.items():
+            with self.subTest(url=url):
+                self.assertEqual(len(set(counts[url])), 1, counts[url])
+                self.assertLessEqual(counts[url][-1], budget)
+
+    def test_input_filters(self):
+        self.grow(3)
+        response = self.client.get(
+            '/admin/recipes/recipe/?author=AUTHOR-1@ex.com&name=Рецепт'
+        )
+        self.assertEqual(
+            list(response.context['cl'].result_list),
+            list(Recipe.objects.filter(author__username='author-1')),
+        )
+        self.assertContains(response, 'name="author" value="AUTHOR-1@ex.com"')
+        self.assertContains(response, 'name="name" value="Рецепт"')
+
+
+class IngredientImportExportTest(TestCase):
+    """Фоновый импорт ингредиентов пачками и потоковый экспорт."""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='admin', email='admin@ex.com', password='password',
+        )
+        self.client.force_login(self.admin)
+        Ingredient.objects.create(name='Соль', measurement_unit='г')
+
+    def get_format(self, formats):
+        return str(formats.index(CSV))
+
+    @mock.patch('recipes.imports.INGREDIENT_IMPORT_BATCH_SIZE', 2)
+    def test_import(self):
+        model_admin = admin.site._registry[Ingredient]
+        content = (
+            'id,name,measurement_unit\n'
+            ',Соль,г\n,Сахар,г\n,Сахар,г\n,Мука,кг\n,,г\n'
+        ).encode()
+        response = self.client.post('/admin/recipes/ingredient/import/', {
+            'import_file': SimpleUploadedFile('data.csv', content),
+            'input_format': self.get_format(
+                model_admin.get_import_formats()
+            ),
+            'resource': '0',
+        })
+        job = IngredientImport.objects.get()
+        url = f'/admin/recipes/ingredient/import/{job.pk}/'
+        self.assertRedirects(response, url)
+        self.assertEqual(
+            self.client.get(url, {'format': 'json'}).json()['status'],
+            'queued',
+        )
+        call_command('run_imports', stdout=StringIO())
+        self.assertEqual(self.client.get(url, {'format': 'json'}).json(), {
+            'status': 'done', 'total': 5, 'processed': 5, 'created': 2,
+            'skipped': 3, 'error': '',
+        })
+        self.assertEqual(
+            sorted(Ingredient.objects.values_list('name', flat=True)),
+            ['Мука', 'Сахар', 'Соль'],
+        )
+        self.assertEqual(bytes(IngredientImport.objects.get().data), b'')
+        self.assertContains(self.client.get(url), 'Обработано строк')
+
+    def test_stale_import_failed(self):
+        """Импорт, воркер которого пропал, не висит в running."""
+        job = IngredientImport.objects.create(
+            data=b'', input_format='CSV',
+            status=IngredientImport.Status.RUNNING,
+            heartbeat=timezone.now() - timedelta(hours=1),
+        )
+        progress = self.client.get(
+            f'/admin/recipes/ingredient/import/{job.pk}/?format=json'
+        ).json()
+        self.assertEqual(progress['status'], 'failed')
+        self.assertEqual(progress['error'], STALE_ERROR)
+        self.assertEqual(self.client.get(
+            '/admin/recipes/ingredient/import/999999/?format=json'
+        ).status_code, 404)
+
+    def test_export_streams_csv(self):
+        model_admin = admin.site._registry[Ingredient]
+        response = self.client.post('/admin/recipes/ingredient/', {
+            'action': 'export_admin_action',
+            'file_format': self.get_format(model_admin.get_export_formats()),
+            '_selected_action': list(
+                Ingredient.objects.values_list('pk', flat=True)
+            ),
+        })
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(content.splitlines()[1].split(',')[1:], ['Соль', 'г'])
+
+
+class SeedScaleTest(TestCase):
+    """seed_scale заполняет базу заданным объёмом данных."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {index}', measurement_unit='г')
+            for index in range(20)
+        )
+
+    def seed(self, **options):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('seed_scale', stdout=StringIO(), seed=1,
+                         batch_size=7, favorites=2, carts=1,
+                         subscriptions=2, **options)
+
+    def test_counts(self):
+        self.seed(users=10, recipes=30, tags=3)
+        self.assertEqual(User.objects.count(), 10)
+        self.assertEqual(Tag.objects.count(), 3)
+        self.assertEqual(Recipe.objects.count(), 30)
+        self.assertEqual(RecipeChange.objects.count(), 30)
+        for recipe in Recipe.objects.prefetch_related('tags', 'recipes'):
+            self.assertTrue(1 <= len(recipe.tags.all()) <= 3)
+            self.assertTrue(recipe.recipes.all())
+        self.assertLessEqual(Favorite.objects.count(), 10 * 4)
+        self.assertLessEqual(ShoppingCart.objects.count(), 10 * 2)
+        self.assertFalse(Subscribe.objects.filter(user=F('author')))
+        response = APIClient(HTTP_HOST='localhost').get('/api/recipes/')
+        self.assertEqual(response.json()['count'], 30)
+
+    def test_repeated(self):
+        """Повторный запуск добавляет данные, не задваивая теги."""
+        self.seed(users=3, recipes=5, tags=2)
+        self.seed(users=3, recipes=5, tags=2)
+        self.assertEqual(User.objects.count(), 6)
+        self.assertEqual(Recipe.objects.count(), 10)
+        self.assertEqual(Tag.objects.count(), 2)
+
+    def test_no_ingredients(self):
+        Ingredient.objects.all().delete()
+        with self.assertRaises(CommandError):
+            self.seed(users=1, recipes=1)
+        self.assertFalse(User.objects.exists())
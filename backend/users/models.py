@@ -2,8 +2,12 @@ from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.core.validators import RegexValidator
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+# Символ # не пропускают валидаторы почты и имени пользователя
+DELETED_SUFFIX = '#deleted-{}'
+
 
 class User(AbstractUser):
     """
@@ -40,6 +44,13 @@ class User(AbstractUser):
         _('email address'),
         max_length=254,
         unique=True)
+    deleted_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True,
+        verbose_name='Дата удаления',
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = [
@@ -56,6 +67,23 @@ class User(AbstractUser):
     def __str__(self) -> str:
         return self.username
 
+    def mark_deleted(self):
+        """
+        Пользователь сразу теряет доступ, его рецепты помечаются
+        сигналом, а строки удалит purge_deleted.
+        Почта и имя получают суффикс, недопустимый в живых значениях:
+        их можно сразу занять заново.
+        """
+        suffix = DELETED_SUFFIX.format(self.pk)
+        for name in ('email', 'username'):
+            max_length = self._meta.get_field(name).max_length
+            setattr(self, name,
+                    getattr(self, name)[:max_length - len(suffix)] + suffix)
+        self.deleted_at = timezone.now()
+        self.is_active = False
+        self.save(update_fields=('deleted_at', 'is_active', 'email',
+                                 'username'))
+
 
 class Subscribe(models.Model):
     """Модель подписки."""